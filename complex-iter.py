@@ -1,6 +1,7 @@
 import sys
 import xml.dom
-from svgpicture import SVGPicture, setAttributes
+import orbits
+from svgpicture import SVGWriter, setAttributes
 
 def axis(pic, start, width, height, (lower, upper)):
     step = width / (upper - lower)
@@ -21,7 +22,12 @@ def axis(pic, start, width, height, (lower, upper)):
         tick.setAttribute('stroke-width', '3')
         g.appendChild(tick)
 
-    for minor_tick
+    for minor_tick in range(0, (upper - lower) * 10 + 1):
+        if minor_tick % 10 == 0:
+            continue
+        x = minor_tick * step / 10.0
+        g.appendChild(pic.line((start[0] + x, start[1] - height / 2.0),
+                               (start[0] + x, start[1] + height / 2.0)))
 
     return g
 
@@ -29,12 +35,23 @@ if __name__ == '__main__':
     pageSizeNominalPixels = ('1280px', '720px')
     size = (1280, 720)
     center = (size[0]/2, size[1]/2)
-    picture = SVGPicture(pageSizeNominalPixels, size)
-
-    # Background.
-    picture.root.appendChild(picture.rect((0, 0), size, fill='white', stroke='none'))
-
-    # Real axis.
-    picture.root.appendChild(axis(picture, (-50, center[1]), size[0] + 100, 6, (-3, 3)))
-
-    picture.save_as('complex-iter.svg')
+    axis_width = size[0] + 100
+    with open('complex-iter.svg', 'w') as f:
+        with SVGWriter(f, pageSizeNominalPixels, size) as picture:
+            # Background.
+            picture.rect((0, 0), size, fill='white', stroke='none')
+
+            # Orbits of z = z*z + c from zero, for a grid of c over the
+            # Mandelbrot set, on the same scale as the axis: red for those
+            # that escape, blue for those that don't.
+            plane = orbits.Plane(center, axis_width / 6)
+            z = orbits.orbits(orbits.grid(complex(-2, -1.2), complex(0.5, 1.2), (60, 40)), 20)
+            escaped = orbits.escaped(z)
+            for (which, color) in ((escaped, '#c00'), (~escaped, '#06c')):
+                with picture.group(stroke=color, fill='none',
+                                   **{ 'stroke-width': 1, 'stroke-opacity': 0.25 }):
+                    for d in orbits.path_data(z[which], plane):
+                        picture.path(d)
+
+            # Real axis.
+            picture.append(axis(picture.dom, (-50, center[1]), axis_width, 6, (-3, 3)))
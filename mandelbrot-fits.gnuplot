@@ -0,0 +1,45 @@
+# Generated by python/analysis.py with the command:
+#
+# $ python python/analysis.py --output mandelbrot-fits.gnuplot mand=mandelbrot.data empty=empty-mandelbrot.data:4 dynamic=mandelbrot-dynamic.data atomic=mandelbrot-atomic.data
+#
+# Don't edit this by hand; see python/analysis.py for what these mean.
+
+# mandelbrot.data, fitted over 1 to 8 threads
+mand_rate = 2854.0822259740444
+mand_limit = 29000
+mand_serial = 0.26141738905843337
+mand_sigma = 0.26141738905843337
+mand_kappa = 0.0
+mand_peak = 0.0
+mand_amdahl(x) = mand_rate * x / (1 + mand_serial * (x - 1))
+mand_usl(x) = mand_rate * x / (1 + mand_sigma * (x - 1) + mand_kappa * x * (x - 1))
+
+# empty-mandelbrot.data, fitted over 1 to 4 threads
+empty_rate = 215999.48250123984
+empty_limit = 1100000
+empty_serial = 0.05514100628419627
+empty_sigma = 0.0
+empty_kappa = 0.015866281054063965
+empty_peak = 7.9389383322213005
+empty_amdahl(x) = empty_rate * x / (1 + empty_serial * (x - 1))
+empty_usl(x) = empty_rate * x / (1 + empty_sigma * (x - 1) + empty_kappa * x * (x - 1))
+
+# mandelbrot-dynamic.data, fitted over 1 to 8 threads
+dynamic_rate = 2811.5213882194907
+dynamic_limit = 29000
+dynamic_serial = 0.02677078505741167
+dynamic_sigma = 0.012891385947354053
+dynamic_kappa = 0.0021029392590996322
+dynamic_peak = 21.66551947119952
+dynamic_amdahl(x) = dynamic_rate * x / (1 + dynamic_serial * (x - 1))
+dynamic_usl(x) = dynamic_rate * x / (1 + dynamic_sigma * (x - 1) + dynamic_kappa * x * (x - 1))
+
+# mandelbrot-atomic.data, fitted over 1 to 8 threads
+atomic_rate = 2829.7503543635944
+atomic_limit = 29000
+atomic_serial = 0.02646998096459114
+atomic_sigma = 0.015423447299092456
+atomic_kappa = 0.0016737172220452627
+atomic_peak = 24.25401836328525
+atomic_amdahl(x) = atomic_rate * x / (1 + atomic_serial * (x - 1))
+atomic_usl(x) = atomic_rate * x / (1 + atomic_sigma * (x - 1) + atomic_kappa * x * (x - 1))
@@ -0,0 +1,96 @@
+from __future__ import division
+import numpy as np
+
+# Compute and draw orbits of z = z*z + c, the iteration behind the
+# Mandelbrot set, for whole grids of c at once, for figures like
+# complex-iter.py's.
+#
+# An orbit is the sequence z0, z1, z2, ... for one c. orbits computes them
+# with NumPy, a step at a time for every c together, as a 2-D complex
+# array with a row per orbit. Once an orbit leaves the circle of radius
+# escape_radius, it can never come back, so the rest of its row is NaN.
+#
+# path_data then turns the whole array into SVG path data in one pass, one
+# path per orbit, so a figure with thousands of orbits has thousands of
+# elements rather than one per segment. With that many, draw with
+# svgpicture's SVGWriter:
+#
+#   z = orbits.orbits(orbits.grid(complex(-2, -1.2), complex(0.5, 1.2), (60, 40)), 30)
+#   for d in orbits.path_data(z, orbits.Plane((640, 360), 230)):
+#       writer.path(d)
+
+escape_radius = 2.0
+
+# Return a flat complex array of the points of a columns by rows grid,
+# spanning the rectangle from the corner lower_left to upper_right.
+def grid(lower_left, upper_right, (columns, rows)):
+    re = np.linspace(lower_left.real, upper_right.real, columns)
+    im = np.linspace(lower_left.imag, upper_right.imag, rows)
+    return (re[np.newaxis, :] + 1j * im[:, np.newaxis]).ravel()
+
+# Return the orbits of z = z*z + c for each c in cs, starting from z0, as a
+# len(cs) by steps + 1 complex array. Each orbit ends with the first point
+# outside radius, if any; the rest of its row is NaN.
+def orbits(cs, steps, z0=0j, radius=escape_radius):
+    cs = np.asarray(cs, dtype=complex).ravel()
+    z = np.empty((cs.size, steps + 1), dtype=complex)
+    z[:, 0] = z0
+    with np.errstate(invalid='ignore'):
+        for i in range(steps):
+            current = z[:, i]
+            # NaN compares false, so escaped orbits stay NaN.
+            inside = np.abs(current) <= radius
+            z[:, i + 1] = np.where(inside, current * current + cs, np.nan)
+    return z
+
+# Return a boolean array, true for each orbit in z that escaped.
+def escaped(z, radius=escape_radius):
+    with np.errstate(invalid='ignore'):
+        return ~(np.abs(z[:, -1]) <= radius)
+
+# A mapping from the complex plane to SVG user units: origin is the SVG
+# point (x, y) where zero goes, and scale is the number of units per unit
+# of the plane. The imaginary axis points up.
+class Plane(object):
+    def __init__(self, origin, scale):
+        self.origin = origin
+        self.scale = scale
+
+    # Return a pair of arrays (x, y) of the SVG coordinates of the points
+    # in z.
+    def to_svg(self, z):
+        return (self.origin[0] + self.scale * z.real,
+                self.origin[1] - self.scale * z.imag)
+
+# Return a list of SVG path data strings, one for each orbit in z that has
+# more than one distinct point, drawing it as a polyline on plane, with
+# coordinates rounded to digits decimal places. Points that round to the
+# same place as the point before them are left out, so an orbit that
+# settles down to a fixed point ends where it gets there.
+def path_data(z, plane, digits=1):
+    (x, y) = plane.to_svg(z)
+    (x, y) = (np.round(x, digits), np.round(y, digits))
+    keep = np.isfinite(x) & np.isfinite(y)
+    keep[:, 1:] &= (x[:, 1:] != x[:, :-1]) | (y[:, 1:] != y[:, :-1])
+
+    # Format every coordinate with a single % operation, for a template
+    # holding a line of path data per orbit.
+    counts = keep.sum(axis=1)
+    drawn = counts > 1
+    keep &= drawn[:, np.newaxis]
+    values = np.empty(2 * keep.sum())
+    (values[0::2], values[1::2]) = (x[keep], y[keep])
+    pair = '%.{0}f %.{0}f'.format(digits)
+    template = '\n'.join('M' + pair + 'L' + ' '.join([pair] * (count - 1))
+                         for count in counts[drawn])
+    if not template:
+        return []
+    return (template % tuple(values.tolist())).split('\n')
+
+# Return an xml.dom group holding a path for each orbit in z, drawn on
+# plane by pic, an SVGPicture, with the given attributes on the group.
+def draw_orbits(pic, z, plane, **attributes):
+    g = pic.group(**attributes)
+    for d in path_data(z, plane):
+        g.appendChild(pic.path(d))
+    return g
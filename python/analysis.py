@@ -0,0 +1,198 @@
+from __future__ import division, print_function
+import argparse
+import math
+import sys
+
+# Fit scaling laws to the worker-count measurements in the .data files, and
+# write a gnuplot include file with the results, so that mandelbrot.gnuplot
+# can draw ideal lines, fitted curves and axis limits from the data instead
+# of from numbers typed in by hand.
+#
+# For each data set, with X(N) the measured rate with N threads, and the
+# speedup C(N) = X(N) / X(1):
+#
+#   Amdahl's law                  C(N) = N / (1 + s (N - 1))
+#   Universal Scalability Law     C(N) = N / (1 + sigma (N - 1) + kappa N (N - 1))
+#
+# where s is the serial fraction, sigma the cost of contention, and kappa
+# the cost of coherency, which makes throughput peak at
+# N = sqrt((1 - sigma) / kappa) and fall off after that. Both laws become
+# linear after rearranging:
+#
+#   N / C(N) - 1 = s (N - 1)
+#   N / C(N) - 1 = sigma (N - 1) + kappa N (N - 1)
+#
+# so they're fitted by least squares, with no intercept, and with none of
+# s, sigma and kappa allowed to be negative, since a negative cost would
+# mean that adding threads speeds each one up. Only
+# measurements with N no greater than the number of cores are fitted: past
+# that, threads just take turns, which neither law describes.
+#
+# To regenerate mandelbrot-fits.gnuplot:
+#
+#   python python/analysis.py --output mandelbrot-fits.gnuplot \
+#       mand=mandelbrot.data empty=empty-mandelbrot.data:4 \
+#       dynamic=mandelbrot-dynamic.data atomic=mandelbrot-atomic.data
+
+default_cores = 8
+
+# Axis limits leave this much room above the highest point or ideal line.
+headroom = 1.25
+
+# Read a .data file in bench.py's rate format, and return a list of
+# (count, rate) pairs.
+def load(filename):
+    points = []
+    with open(filename) as f:
+        for line in f:
+            line = line.split('#', 1)[0].split()
+            if line:
+                points.append((int(line[0]), float(line[1])))
+    return points
+
+# Solve the least squares problem y = a x with no intercept, where each
+# point is (x, y), and return a.
+def fit1(points):
+    return sum(x * y for (x, y) in points) / sum(x * x for (x, _) in points)
+
+# Solve the least squares problem y = a x1 + b x2 with no intercept, where
+# each point is (x1, x2, y), and return (a, b), or None if the problem is
+# degenerate.
+def fit2(points):
+    s11 = sum(x1 * x1 for (x1, _, _) in points)
+    s12 = sum(x1 * x2 for (x1, x2, _) in points)
+    s22 = sum(x2 * x2 for (_, x2, _) in points)
+    s1y = sum(x1 * y for (x1, _, y) in points)
+    s2y = sum(x2 * y for (_, x2, y) in points)
+    determinant = s11 * s22 - s12 * s12
+    if not determinant:
+        return None
+    return ((s22 * s1y - s12 * s2y) / determinant,
+            (s11 * s2y - s12 * s1y) / determinant)
+
+# Return the sum of the squared residuals of y = a x1 + b x2 over points,
+# each of which is (x1, x2, y).
+def residual2(points, a, b):
+    return sum((y - a * x1 - b * x2) ** 2 for (x1, x2, y) in points)
+
+def amdahl(rate, serial, n):
+    return rate * n / (1 + serial * (n - 1))
+
+def usl(rate, sigma, kappa, n):
+    return rate * n / (1 + sigma * (n - 1) + kappa * n * (n - 1))
+
+# Round x up to two significant figures.
+def round_up(x):
+    scale = 10 ** (int(math.floor(math.log10(x))) - 1)
+    return int(math.ceil(x / scale) * scale)
+
+class Fit(object):
+    def __init__(self, name, points, cores=default_cores):
+        self.name = name
+        self.cores = cores
+        rates = dict(points)
+        if 1 not in rates:
+            raise ValueError('{}: no single-thread measurement'.format(name))
+        self.rate = rates[1]
+
+        # (N - 1, N, N / C(N) - 1) for each fitted point.
+        fitted = [(n - 1, n, n * self.rate / rate - 1)
+                  for (n, rate) in sorted(points) if 1 < n <= cores]
+        if len(fitted) < 2:
+            raise ValueError('{}: too few measurements between 2 and {} threads'
+                             .format(name, cores))
+        self.serial = max(0.0, fit1([(x, y) for (x, _, y) in fitted]))
+        usl_points = [(x, n * x, y) for (x, n, y) in fitted]
+        terms = fit2(usl_points)
+        if terms is None or min(terms) < 0:
+            # The best fit has a negative cost, so the best fit without one
+            # has one of the costs at zero: either no coherency cost, which
+            # makes the USL Amdahl's law, or no contention cost.
+            coherency = max(0.0, fit1([(x2, y) for (_, x2, y) in usl_points]))
+            terms = min([(self.serial, 0.0), (0.0, coherency)],
+                        key=lambda terms: residual2(usl_points, *terms))
+        (self.sigma, self.kappa) = terms
+
+        if self.kappa > 0 and self.sigma < 1:
+            self.peak = math.sqrt((1 - self.sigma) / self.kappa)
+        else:
+            self.peak = None
+
+        self.limit = round_up(headroom * max(max(rate for (_, rate) in points),
+                                             self.rate * cores))
+
+    # The coefficient of determination of the USL fit, over the fitted
+    # points.
+    def r_squared(self, points):
+        fitted = [(n, rate) for (n, rate) in points if n <= self.cores]
+        mean = sum(rate for (_, rate) in fitted) / len(fitted)
+        total = sum((rate - mean) ** 2 for (_, rate) in fitted)
+        residual = sum((rate - usl(self.rate, self.sigma, self.kappa, n)) ** 2
+                       for (n, rate) in fitted)
+        return 1 - residual / total if total else 1.0
+
+    # Return gnuplot definitions of this fit's parameters and curves.
+    def gnuplot(self):
+        name = self.name
+        return [
+            '{}_rate = {!r}'.format(name, self.rate),
+            '{}_limit = {}'.format(name, self.limit),
+            '{}_serial = {!r}'.format(name, self.serial),
+            '{}_sigma = {!r}'.format(name, self.sigma),
+            '{}_kappa = {!r}'.format(name, self.kappa),
+            # Zero if throughput never peaks.
+            '{}_peak = {!r}'.format(name, self.peak or 0.0),
+            '{0}_amdahl(x) = {0}_rate * x / (1 + {0}_serial * (x - 1))'.format(name),
+            '{0}_usl(x) = {0}_rate * x / (1 + {0}_sigma * (x - 1) + {0}_kappa * x * (x - 1))'
+            .format(name),
+        ]
+
+# Parse 'NAME=FILE' or 'NAME=FILE:CORES'.
+def parse_data_set(s):
+    (name, _, rest) = s.partition('=')
+    (filename, _, cores) = rest.partition(':')
+    if not name or not filename:
+        raise argparse.ArgumentTypeError('expected NAME=FILE[:CORES], not ' + s)
+    return (name, filename, int(cores) if cores else None)
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Fit scaling laws to .data files and write the results for gnuplot.')
+    parser.add_argument('data_sets', nargs='+', type=parse_data_set,
+                        metavar='NAME=FILE[:CORES]',
+                        help='a data file, and the prefix for its gnuplot variables; '
+                        'CORES overrides --cores for this file')
+    parser.add_argument('--cores', type=int, default=default_cores,
+                        help='fit measurements up to this many threads, and draw ideal '
+                        'lines up to it (default: %(default)s)')
+    parser.add_argument('--output', metavar='FILE',
+                        help='write gnuplot definitions to FILE instead of standard output')
+    args = parser.parse_args(argv[1:])
+
+    lines = ['# Generated by python/analysis.py with the command:',
+             '#',
+             '# $ python ' + ' '.join(argv),
+             '#',
+             "# Don't edit this by hand; see python/analysis.py for what these mean."]
+    print('{:10} {:>10} {:>7} {:>7} {:>9} {:>6} {:>6}'.format(
+        'data', 'rate', 'serial', 'sigma', 'kappa', 'peak', 'R^2'), file=sys.stderr)
+    for (name, filename, cores) in args.data_sets:
+        points = load(filename)
+        fit = Fit(name, points, cores or args.cores)
+        print('{:10} {:10.1f} {:7.4f} {:7.4f} {:9.6f} {:>6} {:6.3f}'.format(
+            name, fit.rate, fit.serial, fit.sigma, fit.kappa,
+            '{:.1f}'.format(fit.peak) if fit.peak else '-', fit.r_squared(points)),
+              file=sys.stderr)
+        lines.append('')
+        lines.append('# {}, fitted over 1 to {} threads'.format(filename, fit.cores))
+        lines.extend(fit.gnuplot())
+
+    text = '\n'.join(lines) + '\n'
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,469 @@
+from __future__ import division, print_function
+import argparse
+import multiprocessing
+from multiprocessing import shared_memory
+import queue
+import sys
+import timeit
+import traceback
+
+import numpy as np
+
+import mandelbrot
+import png
+import settle
+
+# Render the Mandelbrot set in parallel by dividing the image into
+# horizontal bands, as in the 'banding the Mandelbrot' part of the talk.
+#
+# Bands are described by (top, rows) pairs: the index of the band's first
+# row in the full image, and its number of rows. A scheduler decides which
+# worker process renders which band. Each scheduler is a subclass of
+# Scheduler whose constructor takes the image height, the band height and
+# the number of workers, and sets up whatever shared state it needs before
+# the workers start; its bands(worker) method is then called in each worker
+# process, and yields the bands that worker should render.
+#
+# Workers render straight into a single image in shared memory, each band
+# into its own disjoint slice of rows, like the &mut [u8] bands in the Rust
+# code, so no pixels are ever copied between processes. This needs Python
+# 3.8 or later, for multiprocessing.shared_memory.
+
+# Divide height rows into count bands of equal size, except perhaps the
+# last, like the Rust driver's pixels.chunks_mut(band_rows * bounds.0).
+def static_bands(height, count):
+    band_rows = (height + count - 1) // count
+    return row_bands(height, band_rows)
+
+# Divide height rows into bands of band_rows rows, except perhaps the last.
+def row_bands(height, band_rows):
+    return [(top, min(band_rows, height - top))
+            for top in range(0, height, band_rows)]
+
+class Scheduler(object):
+    # Return a scheduler for rendering the given image. Schedulers that
+    # need to look at the image before handing out bands override this.
+    @classmethod
+    def for_image(cls, bounds, ul, lr, limit, band_rows, workers):
+        return cls(bounds[1], band_rows, workers)
+
+# Give each worker one band of nearly equal size, as in the talk's first
+# banded driver. This ignores band_rows.
+class Static(Scheduler):
+    def __init__(self, height, band_rows, workers):
+        self.assigned = static_bands(height, workers)
+
+    def bands(self, worker):
+        return self.assigned[worker : worker + 1]
+
+# Hand out bands from a shared queue, the process equivalent of the talk's
+# Mutex-guarded chunks_mut iterator.
+class SharedQueue(Scheduler):
+    def __init__(self, height, band_rows, workers):
+        self.queue = multiprocessing.Queue()
+        for band in row_bands(height, band_rows):
+            self.queue.put(band)
+        for _ in range(workers):
+            self.queue.put(None)
+
+    def bands(self, worker):
+        while True:
+            band = self.queue.get()
+            if band is None:
+                return
+            yield band
+
+# Claim bands by advancing a shared counter of the next row to render, like
+# the talk's AtomicChunksMut. Python has no atomic fetch-and-add, so the
+# counter is guarded by its own lock, held only for the increment.
+class AtomicCounter(Scheduler):
+    def __init__(self, height, band_rows, workers):
+        self.height = height
+        self.band_rows = band_rows
+        self.next = multiprocessing.Value('l', 0)
+
+    def bands(self, worker):
+        while True:
+            with self.next.get_lock():
+                top = self.next.value
+                self.next.value = min(top + self.band_rows, self.height)
+            if top >= self.height:
+                return
+            yield (top, min(self.band_rows, self.height - top))
+
+# Deal each worker a contiguous run of bands. A worker takes bands from the
+# front of its own run; when that is empty, it steals the back half of
+# another worker's run.
+class WorkStealing(Scheduler):
+    def __init__(self, height, band_rows, workers):
+        self.all_bands = row_bands(height, band_rows)
+        self.workers = workers
+        # Worker i's run is the bands with indices runs[2i] <= j < runs[2i+1],
+        # guarded by locks[i].
+        self.runs = multiprocessing.RawArray('l', 2 * workers)
+        self.locks = [multiprocessing.Lock() for _ in range(workers)]
+        per_worker = (len(self.all_bands) + workers - 1) // workers
+        for i in range(workers):
+            self.runs[2 * i] = min(i * per_worker, len(self.all_bands))
+            self.runs[2 * i + 1] = min((i + 1) * per_worker, len(self.all_bands))
+
+    # Return the index of the next band in worker's own run, or None.
+    def take(self, worker):
+        with self.locks[worker]:
+            head = self.runs[2 * worker]
+            if head < self.runs[2 * worker + 1]:
+                self.runs[2 * worker] = head + 1
+                return head
+        return None
+
+    # Move the back half of some other worker's run to thief's own run.
+    # Return False if there was nothing left to steal.
+    def steal(self, thief):
+        for i in range(1, self.workers):
+            victim = (thief + i) % self.workers
+            with self.locks[victim]:
+                (head, tail) = (self.runs[2 * victim], self.runs[2 * victim + 1])
+                if head == tail:
+                    continue
+                middle = tail - (tail - head + 1) // 2
+                self.runs[2 * victim + 1] = middle
+            with self.locks[thief]:
+                self.runs[2 * thief] = middle
+                self.runs[2 * thief + 1] = tail
+            return True
+        return False
+
+    def bands(self, worker):
+        while True:
+            index = self.take(worker)
+            if index is None:
+                if not self.steal(worker):
+                    return
+                continue
+            yield self.all_bands[index]
+
+# Preview images are this many times smaller than the image in each
+# dimension.
+preview_scale = 8
+
+# Estimate the time it takes to render each row of the image, in seconds,
+# and return the estimates as an array.
+#
+# Rendering costs something for every pixel, something for every iteration
+# of every pixel, and something for every pass of escape_times' loop,
+# however few pixels are left. A low-resolution preview gives each row's
+# iterations. Timing escape_times on a single point that never escapes
+# gives the cost of a pass, and timing full-size blocks rendered just as the
+# workers will, one far outside the set and one from the image, gives the
+# costs of a pixel and an iteration.
+#
+# mandelbrot.render makes a pass for each iteration of the slowest pixel in
+# each block of rows. Once a block reaches inside the circle of radius 2
+# around the set at all, that is nearly always the limit: a block of
+# full-size rows almost always holds some pixel close enough to the set to
+# run that long, even when the preview's rows don't. So rows whose preview
+# points all escape at once are counted as making the one pass, and all
+# others as making limit passes.
+def estimate_row_costs(bounds, ul, lr, limit):
+    preview = (max(1, bounds[0] // preview_scale), max(1, bounds[1] // preview_scale))
+    (re, _) = mandelbrot.pixel_to_point(preview, (np.arange(preview[0]), 0), ul, lr)
+    (_, im) = mandelbrot.pixel_to_point(preview, (0, np.arange(preview[1])), ul, lr)
+    times = mandelbrot.escape_times(np.broadcast_to(re, (preview[1], preview[0])),
+                                    np.broadcast_to(im[:, np.newaxis], (preview[1], preview[0])),
+                                    limit)
+
+    # Each full-size row takes as many iterations as the preview row it
+    # falls in, scaled up by the difference in width.
+    per_pixel = np.where(times < 0, limit, times + 1)
+    preview_row = np.arange(bounds[1]) * preview[1] // bounds[1]
+    iterations = per_pixel.sum(axis=1)[preview_row] * (bounds[0] / preview[0])
+    passes = np.where(per_pixel.max(axis=1) > 1, limit, 1)[preview_row]
+
+    origin = np.zeros((1, 1))
+    start = timeit.default_timer()
+    mandelbrot.escape_times(origin, origin, limit)
+    pass_seconds = (timeit.default_timer() - start) / max(1, limit)
+
+    # Every point of a block centered on 10 + 10i escapes at once.
+    block_rows = mandelbrot.block_rows
+    sample = np.empty((min(block_rows, bounds[1]), bounds[0]), dtype=np.uint8)
+    start = timeit.default_timer()
+    mandelbrot.render(sample, bounds, (ul[0] + 10, ul[1] + 10), (lr[0] + 10, lr[1] + 10),
+                      0, limit)
+    pixel_seconds = max(0.0, timeit.default_timer() - start - pass_seconds) / sample.size
+
+    # Calibrate iterations on the block with the most of them, which takes
+    # long enough to time well.
+    top = max(range(0, bounds[1], block_rows),
+              key=lambda top: iterations[top : top + block_rows].sum())
+    block = slice(top, top + block_rows)
+    sample = sample[:len(iterations[block])]
+    start = timeit.default_timer()
+    mandelbrot.render(sample, bounds, ul, lr, top, limit)
+    elapsed = (timeit.default_timer() - start - sample.size * pixel_seconds
+               - passes[block].max() * pass_seconds)
+    iteration_seconds = max(0.0, elapsed) / iterations[block].sum()
+
+    # Share each block's passes out among its rows.
+    return (bounds[0] * pixel_seconds + iterations * iteration_seconds
+            + passes * pass_seconds / block_rows)
+
+# Give each worker one band, like Static, but cut the bands so that each has
+# an equal share of the estimated cost, from estimate_row_costs. The
+# predicted attribute gives each band's estimated rendering time in
+# seconds. This ignores band_rows.
+class Adaptive(Scheduler):
+    def __init__(self, costs, workers):
+        cumulative = np.cumsum(costs)
+        targets = cumulative[-1] * np.arange(1, workers) / workers
+        cuts = [0] + list(np.searchsorted(cumulative, targets) + 1) + [len(costs)]
+        # Every band gets at least one row, while there are rows to go round.
+        for i in range(1, len(cuts)):
+            cuts[i] = min(max(cuts[i], cuts[i - 1] + 1), len(costs))
+        self.assigned = [(int(top), int(bottom - top))
+                         for (top, bottom) in zip(cuts, cuts[1:]) if bottom > top]
+        self.predicted = [float(costs[top : top + rows].sum())
+                          for (top, rows) in self.assigned]
+
+    @classmethod
+    def for_image(cls, bounds, ul, lr, limit, band_rows, workers):
+        return cls(estimate_row_costs(bounds, ul, lr, limit), workers)
+
+    def bands(self, worker):
+        return self.assigned[worker : worker + 1]
+
+strategies = {
+    'static': Static,
+    'adaptive': Adaptive,
+    'queue': SharedQueue,
+    'atomic': AtomicCounter,
+    'stealing': WorkStealing,
+}
+
+default_band_rows = 8
+
+# A bounds[0] by bounds[1] grayscale image in shared memory. Its pixels
+# attribute is a 2-D uint8 array viewing the shared buffer.
+#
+# Worker processes started by fork simply inherit the mapping. Pickling a
+# SharedImage, as the 'spawn' start method does, passes only its name, and
+# unpickling attaches to the same memory.
+#
+# Use a SharedImage as a context manager, or call close when done with it;
+# the creating process's close also frees the memory. Don't keep references
+# to pixels past that point.
+class SharedImage(object):
+    def __init__(self, bounds, name=None):
+        self.bounds = bounds
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=bounds[0] * bounds[1])
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.pixels = np.ndarray((bounds[1], bounds[0]), dtype=np.uint8,
+                                 buffer=self.memory.buf)
+
+    def __getstate__(self):
+        return (self.bounds, self.memory.name)
+
+    def __setstate__(self, state):
+        (bounds, name) = state
+        self.__init__(bounds, name)
+
+    def close(self):
+        self.pixels = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# The body of each worker process: render the bands scheduler assigns to
+# worker into image, and then send ('load', worker, busy, count) to results,
+# where busy is the time spent rendering count bands. If encode is true,
+# also PNG-encode each band as it's finished, and send ('band', top, rows,
+# encoded) to results. If cpus is a list of CPU numbers, first pin this
+# process to one of them, chosen by worker.
+#
+# If anything goes wrong, send ('error', worker, traceback) instead, for
+# render to raise.
+def work(scheduler, worker, image, ul, lr, limit, shortcuts, results, encode=False,
+         cpus=None):
+    try:
+        settle.pin(cpus, worker)
+        busy = 0.0
+        count = 0
+        for (top, rows) in scheduler.bands(worker):
+            start = timeit.default_timer()
+            band = image.pixels[top : top + rows]
+            mandelbrot.render(band, image.bounds, ul, lr, top, limit, shortcuts)
+            busy += timeit.default_timer() - start
+            count += 1
+            if encode:
+                results.put(('band', top, rows, png.encode_band(band)))
+    except Exception:
+        results.put(('error', worker, traceback.format_exc()))
+        return
+    results.put(('load', worker, busy, count))
+
+# How often render checks for workers that died without a word, in seconds.
+poll_interval = 1.0
+
+# Render the image with the given bounds and corners using workers
+# processes, with bands assigned by strategy, which is either the name of
+# a strategy or a Scheduler. Return a pair
+# (pixels, loads), where pixels is the image as a 2-D uint8 array, and
+# loads[i] is a pair (busy, count) giving the time worker i spent rendering
+# and the number of bands it rendered.
+#
+# If image is a SharedImage, render into it, and return its pixels.
+# Otherwise, render into a temporary SharedImage and return a copy.
+# Shortcuts is passed along to mandelbrot.escape_times.
+#
+# If writer is a png.StreamWriter, the workers also encode each band as
+# they finish it, and this process writes them to writer as they arrive,
+# so the file is written while the image is still being rendered.
+#
+# If cpus is a list of CPU numbers, pin the workers to them, round-robin.
+def render(bounds, ul, lr, workers, strategy='static', band_rows=default_band_rows,
+           limit=255, image=None, shortcuts=(), writer=None, cpus=None):
+    if image is None:
+        with SharedImage(bounds) as image:
+            (pixels, loads) = render(bounds, ul, lr, workers, strategy, band_rows,
+                                     limit, image, shortcuts, writer, cpus)
+            return (pixels.copy(), loads)
+
+    if isinstance(strategy, Scheduler):
+        scheduler = strategy
+    else:
+        scheduler = strategies[strategy].for_image(bounds, ul, lr, limit, band_rows,
+                                                   workers)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=work,
+                                         args=(scheduler, worker, image, ul, lr,
+                                               limit, shortcuts, results,
+                                               writer is not None, cpus))
+                 for worker in range(workers)]
+    for process in processes:
+        process.start()
+
+    loads = [None] * workers
+    finished = 0
+    try:
+        while finished < workers:
+            try:
+                message = results.get(timeout=poll_interval)
+            except queue.Empty:
+                # A worker killed outright, rather than raising an
+                # exception, sends nothing.
+                for (worker, process) in enumerate(processes):
+                    if process.exitcode not in (None, 0):
+                        raise RuntimeError('band worker {} exited with code {}'
+                                           .format(worker, process.exitcode))
+                continue
+            if message[0] == 'band':
+                writer.add(*message[1:])
+            elif message[0] == 'error':
+                (_, worker, trace) = message
+                raise RuntimeError('band worker {} failed:\n{}'.format(worker, trace))
+            else:
+                (_, worker, busy, count) = message
+                loads[worker] = (busy, count)
+                finished += 1
+    finally:
+        if finished < workers:
+            for process in processes:
+                process.terminate()
+        for process in processes:
+            process.join()
+
+    return (image.pixels, loads)
+
+# Render the image as render does, writing it to filename as a PNG while
+# it's being rendered, and return the workers' loads. If image is None,
+# render into a temporary SharedImage.
+def render_png(filename, bounds, ul, lr, workers, strategy='static',
+               band_rows=default_band_rows, limit=255, image=None, shortcuts=()):
+    if image is None:
+        with SharedImage(bounds) as image:
+            return render_png(filename, bounds, ul, lr, workers, strategy, band_rows,
+                              limit, image, shortcuts)
+
+    with open(filename, 'wb') as f:
+        writer = png.StreamWriter(f, bounds)
+        (_, loads) = render(bounds, ul, lr, workers, strategy, band_rows, limit, image,
+                            shortcuts, writer)
+        writer.close()
+    return loads
+
+# The ratio of the busiest worker's rendering time to the average. A
+# perfectly balanced render scores 1.0.
+def imbalance(loads):
+    busy = [load[0] for load in loads]
+    mean = sum(busy) / len(busy)
+    return max(busy) / mean if mean else 1.0
+
+def add_strategy_arguments(parser):
+    parser.add_argument('--strategy', choices=sorted(strategies), default='static',
+                        help='how to assign bands to workers (default: %(default)s)')
+    parser.add_argument('--band-rows', type=int, default=default_band_rows, metavar='N',
+                        help='rows per band, for strategies other than static and '
+                        'adaptive (default: %(default)s)')
+
+# Compare all the strategies on one image, and report their times and load
+# imbalance.
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Compare band scheduling strategies for rendering the Mandelbrot set.')
+    mandelbrot.add_region_arguments(parser)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes (default: %(default)s)')
+    parser.add_argument('--band-rows', type=int, default=default_band_rows, metavar='N',
+                        help='rows per band (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5, metavar='N',
+                        help='renders per strategy (default: %(default)s)')
+    parser.add_argument('--output', metavar='FILE',
+                        help="write the fastest strategy's image to FILE as a PNG")
+    args = parser.parse_args(argv[1:])
+    (bounds, ul, lr) = mandelbrot.region_from_args(args)
+    shortcuts = args.shortcuts
+
+    print('{:10} {:>10} {:>10}'.format('strategy', 'median ms', 'imbalance'))
+    best = None
+    with SharedImage(bounds) as image:
+        for strategy in sorted(strategies):
+            times = []
+            for _ in range(args.repeat):
+                start = timeit.default_timer()
+                (_, loads) = render(bounds, ul, lr, args.workers, strategy,
+                                    args.band_rows, args.limit, image, shortcuts)
+                times.append(timeit.default_timer() - start)
+            median = float(np.median(times))
+            print('{:10} {:10.1f} {:10.2f}'.format(strategy, median * 1000, imbalance(loads)))
+            if best is None or median < best[0]:
+                best = (median, strategy)
+        print('fastest: ' + best[1])
+
+        # Show how well the adaptive strategy's estimates matched reality.
+        scheduler = Adaptive.for_image(bounds, ul, lr, args.limit, args.band_rows,
+                                       args.workers)
+        (_, loads) = render(bounds, ul, lr, args.workers, scheduler, args.band_rows,
+                            args.limit, image, shortcuts)
+        print()
+        print('adaptive bands:')
+        print('{:>5} {:>5} {:>13} {:>10}'.format('top', 'rows', 'predicted ms', 'actual ms'))
+        for ((top, rows), predicted, (busy, _)) in zip(scheduler.assigned,
+                                                       scheduler.predicted, loads):
+            print('{:5} {:5} {:13.1f} {:10.1f}'.format(top, rows, predicted * 1000,
+                                                        busy * 1000))
+
+        if args.output:
+            render_png(args.output, bounds, ul, lr, args.workers, best[1], args.band_rows,
+                       args.limit, image, shortcuts)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,134 @@
+from __future__ import division, print_function
+import argparse
+import sys
+
+import numpy as np
+
+import bands
+import mandelbrot
+import settle
+
+# Measure how Mandelbrot rendering speed varies with the number of workers,
+# and write the results in the formats of the .data files plotted by
+# mandelbrot.gnuplot:
+#
+#   rate          'COUNT RATE', where RATE is the median number of pixels
+#                 rendered per millisecond (mandelbrot.data and friends)
+#   ns-per-image  'COUNT NS STDDEV', the median and standard deviation of the
+#                 time to render the image, in nanoseconds
+#                 (mandelbrot-ns-per-image/mandelbrot-thread-count.data)
+#
+# For example, to regenerate mandelbrot.data, empty-mandelbrot.data and
+# mandelbrot-dynamic.data:
+#
+#   python python/bench.py --output mandelbrot.data
+#   python python/bench.py --region empty --output empty-mandelbrot.data
+#   python python/bench.py --strategy queue --output mandelbrot-dynamic.data
+#
+# Each worker count is timed as settle.sample describes, and the .data
+# file's header notes the CPU governors and load; with --output, the full
+# environment and sampling details go in a .json file next to it.
+
+# The worker counts in mandelbrot.data.
+default_counts = '1-16,20-100:10,200-1000:100'
+
+# Parse a list of worker counts like '1-16,20-100:10': a comma-separated
+# list of single counts, or ranges with an optional ':STEP'.
+def parse_counts(spec):
+    counts = []
+    for part in spec.split(','):
+        (span, _, step) = part.partition(':')
+        (first, _, last) = span.partition('-')
+        last = last or first
+        counts.extend(range(int(first), int(last) + 1, int(step or 1)))
+    return counts
+
+# Time rendering the image with workers processes, sampling as args say
+# (see settle.add_arguments), and return a settle.Sample. See bands.render
+# for cpus.
+def measure(bounds, ul, lr, workers, limit, strategy, band_rows, shortcuts, args,
+            cpus=None):
+    def run():
+        bands.render(bounds, ul, lr, workers, strategy, band_rows, limit,
+                     shortcuts=shortcuts, cpus=cpus)
+    return settle.sample_from_args(run, args)
+
+def format_line(format, bounds, count, times):
+    median = float(np.median(times))
+    if format == 'rate':
+        pixels = bounds[0] * bounds[1]
+        return '{} {!r}'.format(count, pixels / (median * 1000))
+    else:
+        stddev = float(np.std(times, ddof=1)) if len(times) > 1 else 0.0
+        return '{} {!r} {!r}'.format(count, median * 1e9, stddev * 1e9)
+
+# Return the comment lines that begin a .data file, recording the command
+# that produced it and the image it rendered, followed by the comment lines
+# in notes.
+def header(program, argv, bounds, ul, lr, notes=()):
+    return (['# Produced by {} with the command:'.format(program),
+             '#',
+             '# $ python ' + ' '.join(argv),
+             '#',
+             '# rendering {}x{} {},{} {},{}'.format(bounds[0], bounds[1],
+                                                    ul[0], ul[1], lr[0], lr[1])]
+            + list(notes)
+            + [''])
+
+# Write lines to the file named output, or to standard output if it's None.
+def write_lines(lines, output):
+    if output:
+        with open(output, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+    else:
+        print('\n'.join(lines))
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Measure Mandelbrot rendering speed for a range of worker counts.')
+    mandelbrot.add_region_arguments(parser)
+    bands.add_strategy_arguments(parser)
+    parser.add_argument('--counts', default=default_counts, metavar='LIST',
+                        help='worker counts to try, like 1-8,10-100:10 (default: %(default)s)')
+    settle.add_arguments(parser)
+    parser.add_argument('--pin', action='store_true',
+                        help='pin each worker process to its own CPU, round-robin')
+    parser.add_argument('--format', choices=['rate', 'ns-per-image'], default='rate',
+                        help='output format (default: %(default)s)')
+    parser.add_argument('--output', metavar='FILE',
+                        help='write results to FILE instead of standard output')
+    args = parser.parse_args(argv[1:])
+
+    (bounds, ul, lr) = mandelbrot.region_from_args(args)
+    shortcuts = args.shortcuts
+
+    # Shortcuts must not change the image; make sure before timing them.
+    if shortcuts:
+        differences = mandelbrot.verify(bounds, ul, lr, args.limit, shortcuts)
+        if differences:
+            sys.exit('shortcuts {} change {} pixels'.format(','.join(shortcuts),
+                                                           differences))
+
+    env = settle.environment()
+    notes = settle.summary(env)
+    print('\n'.join(notes), file=sys.stderr)
+    if args.strict and settle.warnings(env):
+        sys.exit('machine is too noisy to benchmark; see the warnings above')
+    cpus = settle.allowed_cpus() if args.pin else None
+
+    lines = header('python/bench.py', argv, bounds, ul, lr, notes)
+    samples = []
+    for count in parse_counts(args.counts):
+        sample = measure(bounds, ul, lr, count, args.limit, args.strategy, args.band_rows,
+                         shortcuts, args, cpus)
+        samples.append((count, sample))
+        line = format_line(args.format, bounds, count, sample.times)
+        print('{}    ({} runs, {} outliers)'.format(line, sample.runs, sample.rejected),
+              file=sys.stderr)
+        lines.append(line)
+    write_lines(lines, args.output)
+    if args.output:
+        settle.write_metadata(args.output, argv, env, samples)
+
+if __name__ == '__main__':
+    main(sys.argv)
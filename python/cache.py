@@ -0,0 +1,96 @@
+from __future__ import print_function
+import codecs
+import hashlib
+import os
+
+# An on-disk cache of rendered slide fragments, so that rebuilding the deck
+# only re-renders the slides that actually changed.
+#
+# Each fragment is stored in its own file, named by a hash of the slide's
+# class and attributes (including its Content children) and of the source of
+# the renderer itself. Editing a slide changes its key; editing slides.py or
+# dom.py changes every key.
+#
+# Other generated markup can be kept the same way, under keys of its own and
+# with its own file extension; name is what report calls it.
+
+renderer_sources = ['slides.py', 'dom.py']
+
+def renderer_version():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.sha1()
+    for name in renderer_sources:
+        with open(os.path.join(directory, name), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+# Feed a canonical description of value into the hash h. Strings and other
+# scalars go in as their repr, which is unambiguous; sequences include their
+# length; objects include their class and their attributes, sorted by name.
+def fingerprint(h, value):
+    if isinstance(value, (list, tuple)):
+        h.update('[{}'.format(len(value)))
+        for item in value:
+            fingerprint(h, item)
+    elif hasattr(value, '__dict__'):
+        cls = type(value)
+        attributes = vars(value)
+        h.update('<{}.{} {}'.format(cls.__module__, cls.__name__, len(attributes)))
+        for key in sorted(attributes):
+            h.update(repr(key))
+            fingerprint(h, attributes[key])
+    else:
+        h.update(repr(value))
+
+class RenderCache(object):
+    def __init__(self, directory, extension='.html', name='slides'):
+        self.directory = directory
+        self.extension = extension
+        self.name = name
+        self.version = renderer_version()
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, slide):
+        h = hashlib.sha1(self.version)
+        fingerprint(h, slide)
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.extension)
+
+    # Return true if there is a fragment cached under key, and count the
+    # lookup as a hit or a miss.
+    def contains(self, key):
+        self.used.add(key)
+        if os.path.exists(self.path(key)):
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def get(self, key):
+        with codecs.open(self.path(key), 'r', 'utf-8') as f:
+            return f.read()
+
+    def put(self, key, fragment):
+        path = self.path(key)
+        # Write to a temporary name and rename, so that an interrupted build
+        # never leaves a truncated fragment behind.
+        temp = '{}.{}.tmp'.format(path, os.getpid())
+        with codecs.open(temp, 'w', 'utf-8') as f:
+            f.write(fragment)
+        os.rename(temp, path)
+
+    # Delete every cached fragment that wasn't used by this build.
+    def prune(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(self.extension) and name[:-len(self.extension)] not in self.used:
+                os.remove(os.path.join(self.directory, name))
+
+    def report(self, file):
+        print('{}: {} rendered, {} from cache'.format(self.name, self.misses, self.hits),
+              file=file)
@@ -0,0 +1,253 @@
+from __future__ import division
+import hashlib
+import math
+import os
+import sys
+
+import analysis
+from cache import fingerprint
+
+# svgpicture.py lives at the top of the tree, with complex-iter.py.
+top = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.append(top)
+from svgpicture import SVGPicture
+
+# Draw the speedup charts from mandelbrot.gnuplot as SVG, straight from the
+# .data files, for inlining into the deck (see the Chart slide in
+# slides.py) in place of gnuplot's PNGs. They look like gnuplot's charts:
+# a box with ticks, the measurements as points, and ideal speedup lines,
+# with the single-thread rates and axis limits that python/analysis.py
+# computes for mandelbrot-fits.gnuplot.
+#
+# Drawing a chart means reading and fitting its data, so finished charts
+# are kept in a cache.RenderCache, keyed by a hash of the chart's spec, the
+# contents of its .data files, and the source of this file, analysis.py,
+# which fits the data, and svgpicture.py. Only charts whose data or spec
+# changed, or whose drawing or fitting code changed, are redrawn.
+
+chart_sources = [os.path.join(top, 'python', 'charts.py'),
+                 os.path.join(top, 'python', 'analysis.py'),
+                 os.path.join(top, 'svgpicture.py')]
+
+# The size of gnuplot's PNGs, in user units.
+width = 1200
+height = 900
+
+# The plot area, inside the axis labels.
+plot_left = 170
+plot_right = width - 40
+plot_top = 40
+plot_bottom = height - 110
+
+font_size = 24
+line_width = 3
+marker_size = 10
+
+# gnuplot's default colors, in the order it uses them.
+colors = ['#9400d3', '#009e73', '#56b4e9', '#e69f00', '#f0e442', '#0072b2', '#e51e10']
+
+# A chart of measurements against thread count.
+#
+#   x_max     the largest thread count shown
+#   x_step    the distance between x axis ticks, or None to choose one
+#   series    a list of (filename, title) pairs: .data files to plot as points
+#   ideals    a list of (cores, title) pairs: ideal speedup lines, rising
+#             at the single-thread rate up to cores threads and then flat,
+#             or rising forever if cores is None
+#   rate      the .data file whose single-thread rate the ideal lines use,
+#             and whose fitted axis limit the chart uses
+#   cores     the number of cores to fit rate over (see analysis.Fit)
+class ChartSpec(object):
+    def __init__(self, x_max, series, ideals=(), rate=None, x_step=None,
+                 cores=analysis.default_cores):
+        self.x_max = x_max
+        self.x_step = x_step
+        self.series = list(series)
+        self.ideals = list(ideals)
+        self.rate = rate or self.series[0][0]
+        self.cores = cores
+
+    def files(self):
+        return sorted(set([self.rate] + [filename for (filename, _) in self.series]))
+
+# The charts mandelbrot.gnuplot draws, by the name of its PNG.
+mand = ('mandelbrot.data', 'median render speed')
+eight_four = [(8, 'eight-core ideal'), (4, 'four-core ideal')]
+dynamic_static = [('mandelbrot-dynamic.data', 'median render speed, dynamic'),
+                  ('mandelbrot.data', 'median render speed, static')]
+dynamic_ideals = [(4, 'four-core ideal'), (8, 'eight-core ideal')]
+
+gnuplot_charts = {
+    'images/mandelbrot-8-no-ideal.png': ChartSpec(8, [mand], x_step=1),
+    'images/mandelbrot-8.png': ChartSpec(8, [mand], [(None, 'ideal')], x_step=1),
+    'images/mandelbrot-16.png': ChartSpec(16, [mand], eight_four, x_step=1),
+    'images/mandelbrot-100.png': ChartSpec(100, [mand], eight_four),
+    'images/mandelbrot-1000.png': ChartSpec(1000, [mand], eight_four),
+    'images/empty-mandelbrot-8.png':
+        ChartSpec(8, [('empty-mandelbrot.data', 'median render speed')],
+                  [(4, 'four-core ideal')], x_step=1, cores=4),
+    'images/empty-mandelbrot-16.png':
+        ChartSpec(16, [('empty-mandelbrot.data', 'median render speed')],
+                  [(4, 'four-core ideal')], x_step=1, cores=4),
+    'images/mandelbrot-dynamic-8.png':
+        ChartSpec(8, [('mandelbrot-dynamic.data', 'median render speed')],
+                  [(None, 'ideal')], x_step=1),
+    'images/mandelbrot-dynamic-16.png':
+        ChartSpec(16, dynamic_static, dynamic_ideals, x_step=1),
+    'images/mandelbrot-dynamic-100.png':
+        ChartSpec(100, dynamic_static, dynamic_ideals),
+    'images/mandelbrot-lockfree-16.png':
+        ChartSpec(16, dynamic_static
+                  + [('mandelbrot-atomic.data', 'median render speed, lock-free')],
+                  dynamic_ideals, rate='mandelbrot-dynamic.data', x_step=1),
+}
+
+# Return the hash of everything that goes into drawing spec.
+def digest(spec):
+    h = hashlib.sha1()
+    for name in chart_sources:
+        with open(name, 'rb') as f:
+            h.update(f.read())
+    fingerprint(h, spec)
+    for name in spec.files():
+        with open(name, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+# Return a tick spacing that puts between about five and ten ticks on an
+# axis running from zero to limit: 1, 2 or 5 times a power of ten.
+def tick_step(limit):
+    power = 10 ** int(math.floor(math.log10(limit / 10)))
+    for multiple in (1, 2, 5, 10):
+        if limit / (multiple * power) <= 10:
+            return multiple * power
+
+# Format a coordinate compactly: to a tenth of a unit, without a trailing '.0'.
+def number(x):
+    s = '{:.1f}'.format(x)
+    return s[:-2] if s.endswith('.0') else s
+
+# Return the path data for a plus marker at each of points.
+def plus_markers(points):
+    return ''.join('M{} {}h{}M{} {}v{}'.format(number(x - marker_size), number(y),
+                                               2 * marker_size,
+                                               number(x), number(y - marker_size),
+                                               2 * marker_size)
+                   for (x, y) in points)
+
+def cross_markers(points):
+    return ''.join('M{} {}l{} {}M{} {}l{} {}'.format(
+        number(x - marker_size), number(y - marker_size), 2 * marker_size, 2 * marker_size,
+        number(x - marker_size), number(y + marker_size), 2 * marker_size, -2 * marker_size)
+                   for (x, y) in points)
+
+def star_markers(points):
+    return plus_markers(points) + cross_markers(points)
+
+# gnuplot's first three point types.
+markers = [plus_markers, cross_markers, star_markers]
+
+# Return the vertices of the ideal line for rate and cores from zero to
+# x_max threads, cut off where it reaches limit.
+def ideal_line(rate, cores, x_max, limit):
+    knee = x_max if cores is None else min(cores, x_max)
+    vertices = [(0, 0), (knee, rate * knee), (x_max, rate * knee)]
+    clipped = [vertices[0]]
+    for (x, y) in vertices[1:]:
+        (px, py) = clipped[-1]
+        if y > limit:
+            clipped.append((px + (x - px) * (limit - py) / (y - py), limit))
+            break
+        clipped.append((x, y))
+    return clipped
+
+# Draw the chart for spec, and return it as an SVG element's markup.
+def draw(spec):
+    fits = {}
+    def fit(filename):
+        if filename not in fits:
+            points = analysis.load(filename)
+            fits[filename] = (points, analysis.Fit(filename, points, spec.cores))
+        return fits[filename]
+
+    (_, rate_fit) = fit(spec.rate)
+    limit = rate_fit.limit
+    def to_svg(x, y):
+        return (plot_left + x * (plot_right - plot_left) / spec.x_max,
+                plot_bottom - y * (plot_bottom - plot_top) / limit)
+
+    pic = SVGPicture((str(width), str(height)), (width, height))
+    pic.root.setAttribute('class', 'gnuplot')
+    chart = pic.group(**{ 'font-family': 'DejaVu Sans, sans-serif',
+                          'font-size': font_size,
+                          'stroke-width': line_width,
+                          'fill': 'none' })
+    pic.root.appendChild(chart)
+
+    # The box and its ticks, which point inwards, as gnuplot's do.
+    frame = []
+    labels = pic.group(fill='black', stroke='none')
+    x_step = spec.x_step or tick_step(spec.x_max)
+    for i in range(int(spec.x_max // x_step) + 1):
+        (x, _) = to_svg(i * x_step, 0)
+        frame.append('M{0} {1}v-12M{0} {2}v12'.format(number(x), plot_bottom, plot_top))
+        labels.appendChild(pic.text(str(i * x_step), x=number(x), y=plot_bottom + 36,
+                                    **{ 'text-anchor': 'middle' }))
+    y_step = tick_step(limit)
+    for i in range(int(limit // y_step) + 1):
+        (_, y) = to_svg(0, i * y_step)
+        frame.append('M{1} {0}h12M{2} {0}h-12'.format(number(y), plot_left, plot_right))
+        labels.appendChild(pic.text(str(i * y_step), x=plot_left - 12, y=number(y + 8),
+                                    **{ 'text-anchor': 'end' }))
+    frame.append('M{} {}H{}V{}H{}Z'.format(plot_left, plot_top, plot_right, plot_bottom,
+                                          plot_left))
+    chart.appendChild(pic.path(''.join(frame), stroke='black', **{ 'stroke-width': 1 }))
+
+    labels.appendChild(pic.text('threads', x=(plot_left + plot_right) // 2,
+                                y=height - 20, **{ 'text-anchor': 'middle' }))
+    middle = (plot_top + plot_bottom) // 2
+    labels.appendChild(pic.text('pixels / ms', x=40, y=middle,
+                                transform='rotate(-90 40 {})'.format(middle),
+                                **{ 'text-anchor': 'middle' }))
+    chart.appendChild(labels)
+
+    # The data, then the ideal lines, with a legend entry for each.
+    legend = []
+    for (i, (filename, title)) in enumerate(spec.series):
+        (points, _) = fit(filename)
+        shown = [to_svg(n, rate) for (n, rate) in points if n <= spec.x_max and rate <= limit]
+        chart.appendChild(pic.path(markers[i % len(markers)](shown),
+                                   stroke=colors[i % len(colors)]))
+        legend.append((title, markers[i % len(markers)], colors[i % len(colors)]))
+    for (i, (cores, title)) in enumerate(spec.ideals, len(spec.series)):
+        vertices = [to_svg(x, y)
+                    for (x, y) in ideal_line(rate_fit.rate, cores, spec.x_max, limit)]
+        chart.appendChild(pic.path('M' + 'L'.join('{} {}'.format(number(x), number(y))
+                                                  for (x, y) in vertices),
+                                   stroke=colors[i % len(colors)]))
+        legend.append((title, None, colors[i % len(colors)]))
+
+    # gnuplot's legend is at the top right, with the samples to the right
+    # of right-aligned titles.
+    for (i, (title, marker, color)) in enumerate(legend):
+        y = plot_top + 36 + i * 32
+        chart.appendChild(pic.text(title, x=plot_right - 130, y=y, fill='black', stroke='none',
+                                   **{ 'text-anchor': 'end' }))
+        sample_y = y - 8
+        if marker:
+            d = marker([(plot_right - 70, sample_y)])
+        else:
+            d = 'M{} {}h80'.format(plot_right - 110, sample_y)
+        chart.appendChild(pic.path(d, stroke=color))
+
+    return unicode(pic.root.toxml())
+
+# Return the markup for spec, from cache, a cache.RenderCache, if it's
+# there, and otherwise drawing it and adding it.
+def cached_draw(spec, cache):
+    key = digest(spec)
+    if cache.contains(key):
+        return cache.get(key)
+    markup = draw(spec)
+    cache.put(key, markup)
+    return markup
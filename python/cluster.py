@@ -0,0 +1,416 @@
+from __future__ import division, print_function
+import argparse
+import collections
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+
+import numpy as np
+
+import bands
+import bench
+import mandelbrot
+import settle
+
+# Render the Mandelbrot set on several machines at once: a coordinator
+# hands out bands to worker processes over sockets, and they send back the
+# rendered pixels. This takes the banding from the talk past the cores of a
+# single machine.
+#
+# Addresses are either 'HOST:PORT', for TCP, or 'unix:PATH', for a Unix
+# domain socket. To try it out on one host, let the coordinator start some
+# local workers as stand-ins for other machines:
+#
+#   python python/cluster.py bench --spawn --counts 1-8 --output cluster.data
+#
+# or run workers by hand, on this machine or others:
+#
+#   python python/cluster.py bench --listen 0.0.0.0:7878 --counts 1-8
+#   python python/cluster.py worker coordinator-host:7878     # on each node
+#
+# The protocol: every message is a header, packed as header_format, giving
+# the message type and the length of the payload that follows, packed as
+# shown below. Numbers are big-endian.
+#
+#   HELLO   worker to coordinator, on connecting: magic, protocol_version
+#   IMAGE   coordinator to worker, before its first band of each image:
+#           image, width, height, ul re, ul im, lr re, lr im, limit,
+#           shortcuts (bit i set for mandelbrot.all_shortcuts[i])
+#   BAND    coordinator to worker: image, top, rows
+#   PIXELS  worker to coordinator: image, top, rows, and then the band's
+#           rows * width pixels, one byte each
+#   QUIT    coordinator to worker: no payload
+#
+# The coordinator keeps up to pipeline_depth bands outstanding with each
+# worker, so a worker always has its next band waiting when it finishes
+# one, and workers answer bands in the order they received them. If a
+# worker disconnects, sends something unexpected, or takes longer than the
+# timeout to answer, the coordinator counts it as lost, and puts its
+# outstanding bands back on the queue for the others.
+
+header_format = '>BI'
+hello_format = '>4sH'
+image_format = '>IIIddddIB'
+band_format = '>III'
+
+(HELLO, IMAGE, BAND, PIXELS, QUIT) = range(1, 6)
+
+magic = b'MDLB'
+protocol_version = 1
+
+pipeline_depth = 2
+
+default_timeout = 60.0
+
+class ProtocolError(Exception):
+    pass
+
+def recv_exactly(sock, size):
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError('connection closed')
+        received += count
+    return data
+
+def send_message(sock, kind, *parts):
+    payload = b''.join(parts)
+    sock.sendall(struct.pack(header_format, kind, len(payload)) + payload)
+
+# Receive a message, and return (kind, payload).
+def recv_message(sock):
+    (kind, length) = struct.unpack(header_format,
+                                   recv_exactly(sock, struct.calcsize(header_format)))
+    return (kind, recv_exactly(sock, length))
+
+def expect(kind, expected):
+    if kind != expected:
+        raise ProtocolError('expected message type {}, got {}'.format(expected, kind))
+
+def shortcut_bits(shortcuts):
+    return sum(1 << i for (i, name) in enumerate(mandelbrot.all_shortcuts)
+               if name in shortcuts)
+
+def shortcut_names(bits):
+    return tuple(name for (i, name) in enumerate(mandelbrot.all_shortcuts)
+                 if bits & (1 << i))
+
+# Parse 'unix:PATH' or 'HOST:PORT', and return (family, address) for
+# socket.socket and its connect or bind methods.
+def parse_address(address):
+    if address.startswith('unix:'):
+        return (socket.AF_UNIX, address[len('unix:'):])
+    (host, _, port) = address.rpartition(':')
+    return (socket.AF_INET, (host, int(port)))
+
+# The image being rendered, and the bands of it still to do.
+class Image(object):
+    def __init__(self, number, bounds, ul, lr, limit, shortcuts, band_rows):
+        self.number = number
+        self.bounds = bounds
+        self.message = struct.pack(image_format, number, bounds[0], bounds[1],
+                                   ul[0], ul[1], lr[0], lr[1], limit,
+                                   shortcut_bits(shortcuts))
+        self.pixels = np.empty((bounds[1], bounds[0]), dtype=np.uint8)
+        self.pending = collections.deque(bands.row_bands(bounds[1], band_rows))
+        self.remaining = len(self.pending)
+
+# The coordinator's end of a worker's connection.
+class Connection(object):
+    def __init__(self, sock, number):
+        self.sock = sock
+        self.number = number
+        # The (image, top, rows) triples sent to the worker and not yet
+        # answered, oldest first.
+        self.outstanding = collections.deque()
+        self.image = None
+        self.bands = 0
+
+class Coordinator(object):
+    def __init__(self, listen, timeout=default_timeout):
+        (family, address) = parse_address(listen)
+        self.listener = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(address)
+        self.listener.listen(64)
+        self.timeout = timeout
+
+        self.condition = threading.Condition()
+        self.image = None
+        self.images = 0
+        # Live connections, in the order they connected. Only the first
+        # active of them are given bands.
+        self.live = []
+        self.active = 0
+        self.closing = False
+        self.threads = []
+        self.lost = 0
+        self.reissued = 0
+
+    # Wait for count workers to connect, and start serving each of them on
+    # its own thread. Give up after timeout seconds.
+    def accept(self, count, timeout=30.0):
+        self.listener.settimeout(timeout)
+        for _ in range(count):
+            (sock, address) = self.listener.accept()
+            sock.settimeout(self.timeout)
+            if sock.family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            (kind, payload) = recv_message(sock)
+            expect(kind, HELLO)
+            if struct.unpack(hello_format, payload) != (magic, protocol_version):
+                raise ProtocolError('worker at {} speaks a different protocol'.format(address))
+            with self.condition:
+                connection = Connection(sock, len(self.threads) + 1)
+                self.live.append(connection)
+            thread = threading.Thread(target=self.serve, args=(connection,))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    # Whether connection should be taking bands from the queue: there is an
+    # image with bands left, and connection is among the active workers.
+    def wanted(self, connection):
+        return (self.image is not None and self.image.pending
+                and self.live.index(connection) < self.active
+                and len(connection.outstanding) < pipeline_depth)
+
+    # The body of each connection's thread: send the worker bands, and copy
+    # the pixels it sends back into the image.
+    def serve(self, connection):
+        try:
+            while True:
+                with self.condition:
+                    while not connection.outstanding and not self.wanted(connection):
+                        if self.closing:
+                            send_message(connection.sock, QUIT)
+                            return
+                        self.condition.wait()
+                    sending = []
+                    while self.wanted(connection):
+                        (top, rows) = self.image.pending.popleft()
+                        sending.append((self.image, top, rows))
+                        connection.outstanding.append(sending[-1])
+
+                for (image, top, rows) in sending:
+                    if connection.image is not image:
+                        send_message(connection.sock, IMAGE, image.message)
+                        connection.image = image
+                    send_message(connection.sock, BAND,
+                                 struct.pack(band_format, image.number, top, rows))
+
+                (image, top, rows) = connection.outstanding[0]
+                (kind, payload) = recv_message(connection.sock)
+                expect(kind, PIXELS)
+                offset = struct.calcsize(band_format)
+                if (struct.unpack(band_format, payload[:offset]) != (image.number, top, rows)
+                    or len(payload) - offset != rows * image.bounds[0]):
+                    raise ProtocolError('worker sent the wrong band')
+                image.pixels[top : top + rows] = \
+                    np.frombuffer(payload, np.uint8, offset=offset).reshape(rows, -1)
+
+                with self.condition:
+                    connection.outstanding.popleft()
+                    connection.bands += 1
+                    image.remaining -= 1
+                    if not image.remaining:
+                        self.condition.notify_all()
+        except (OSError, ProtocolError, struct.error) as error:
+            with self.condition:
+                self.live.remove(connection)
+                self.lost += 1
+                for (image, top, rows) in reversed(connection.outstanding):
+                    if image is self.image:
+                        image.pending.appendleft((top, rows))
+                        self.reissued += 1
+                connection.outstanding.clear()
+                self.condition.notify_all()
+            if not self.closing:
+                print('lost worker {}: {}'.format(connection.number, error), file=sys.stderr)
+        finally:
+            connection.sock.close()
+
+    # Render an image with the first workers of the connected workers, and
+    # return it as a 2-D uint8 array. Raise RuntimeError if every worker is
+    # lost before it's finished.
+    def render(self, bounds, ul, lr, workers, limit=255, shortcuts=(),
+               band_rows=bands.default_band_rows):
+        with self.condition:
+            if workers > len(self.live):
+                raise RuntimeError('asked for {} workers, but only {} are connected'
+                                   .format(workers, len(self.live)))
+            self.images += 1
+            image = Image(self.images, bounds, ul, lr, limit, shortcuts, band_rows)
+            self.image = image
+            self.active = workers
+            self.condition.notify_all()
+            while image.remaining:
+                if not self.live:
+                    raise RuntimeError('all workers lost')
+                self.condition.wait()
+            self.image = None
+        return image.pixels
+
+    # Tell the workers to exit, and stop listening.
+    def close(self):
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.listener.close()
+
+# Connect to the coordinator at address, and render the bands it sends
+# until it says to quit. If fail_after is not None, exit abruptly after
+# that many bands, as if the node had gone down.
+def worker(address, fail_after=None):
+    (family, address) = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.connect(address)
+    if family == socket.AF_INET:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    send_message(sock, HELLO, struct.pack(hello_format, magic, protocol_version))
+
+    images = {}
+    rendered = 0
+    while True:
+        (kind, payload) = recv_message(sock)
+        if kind == QUIT:
+            break
+        elif kind == IMAGE:
+            (number, width, height, ul_re, ul_im, lr_re, lr_im, limit, bits) = \
+                struct.unpack(image_format, payload)
+            # Only the latest image will get any more bands.
+            images = { number: ((width, height), (ul_re, ul_im), (lr_re, lr_im), limit,
+                                shortcut_names(bits)) }
+        elif kind == BAND:
+            (number, top, rows) = struct.unpack(band_format, payload)
+            (bounds, ul, lr, limit, shortcuts) = images[number]
+            pixels = np.empty((rows, bounds[0]), dtype=np.uint8)
+            mandelbrot.render(pixels, bounds, ul, lr, top, limit, shortcuts)
+            if fail_after is not None and rendered == fail_after:
+                os._exit(1)
+            send_message(sock, PIXELS, payload, pixels.tobytes())
+            rendered += 1
+        else:
+            raise ProtocolError('unexpected message type {}'.format(kind))
+    sock.close()
+
+# Start a local worker process connected to address, and return its Popen
+# object. See worker for fail_after.
+def spawn(address, fail_after=None):
+    command = [sys.executable, os.path.abspath(__file__), 'worker', address]
+    if fail_after is not None:
+        command += ['--fail-after', str(fail_after)]
+    return subprocess.Popen(command)
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Render the Mandelbrot set on a cluster of worker processes.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    work = commands.add_parser('worker', help='render bands for a coordinator')
+    work.add_argument('address', help='the coordinator to connect to: HOST:PORT or unix:PATH')
+    work.add_argument('--fail-after', type=int, metavar='N',
+                      help='exit abruptly after rendering N bands, to simulate a lost node')
+
+    measure = commands.add_parser(
+        'bench', help='measure rendering speed for a range of worker counts')
+    mandelbrot.add_region_arguments(measure)
+    measure.add_argument('--listen', metavar='ADDRESS',
+                         help='address to listen on: HOST:PORT or unix:PATH '
+                         '(default: a Unix socket in a temporary directory)')
+    measure.add_argument('--spawn', action='store_true',
+                         help='start the workers locally, as stand-ins for other machines')
+    measure.add_argument('--failures', type=int, default=0, metavar='N',
+                         help='with --spawn, start N extra workers that fail partway '
+                         'through')
+    measure.add_argument('--timeout', type=float, default=default_timeout, metavar='SECONDS',
+                         help='count a worker as lost if it takes longer than this to '
+                         'answer (default: %(default)s)')
+    measure.add_argument('--band-rows', type=int, default=bands.default_band_rows,
+                         metavar='N', help='rows per band (default: %(default)s)')
+    measure.add_argument('--counts', default='1-8', metavar='LIST',
+                         help='worker counts to try, like 1-8,10-100:10 (default: %(default)s)')
+    settle.add_arguments(measure)
+    measure.add_argument('--format', choices=['rate', 'ns-per-image'], default='rate',
+                         help='output format (default: %(default)s)')
+    measure.add_argument('--output', metavar='FILE',
+                         help='write results to FILE instead of standard output')
+    args = parser.parse_args(argv[1:])
+
+    if args.command == 'worker':
+        worker(args.address, args.fail_after)
+        return
+
+    (bounds, ul, lr) = mandelbrot.region_from_args(args)
+    counts = bench.parse_counts(args.counts)
+    # This describes only the coordinator's machine, which is all of them
+    # with --spawn.
+    env = settle.environment()
+    notes = settle.summary(env)
+    print('\n'.join(notes), file=sys.stderr)
+    if args.strict and settle.warnings(env):
+        sys.exit('machine is too noisy to benchmark; see the warnings above')
+    directory = None
+    listen = args.listen
+    if listen is None:
+        directory = tempfile.mkdtemp()
+        listen = 'unix:' + os.path.join(directory, 'coordinator')
+
+    coordinator = Coordinator(listen, args.timeout)
+    processes = []
+    try:
+        if args.spawn:
+            # Start the failing workers first, one at a time, so that they
+            # connect first and are handed bands at the first worker count.
+            # Each sends back three bands and dies on its fourth, while that
+            # count is being measured, and doesn't come back: the
+            # coordinator reissues the band it was rendering to the others,
+            # and later counts run without it.
+            for _ in range(args.failures):
+                processes.append(spawn(listen, fail_after=3))
+                coordinator.accept(1)
+            for _ in range(max(counts)):
+                processes.append(spawn(listen))
+        else:
+            print('waiting for {} workers on {}'.format(max(counts), listen),
+                  file=sys.stderr)
+        coordinator.accept(max(counts))
+
+        lines = bench.header('python/cluster.py', argv, bounds, ul, lr, notes)
+        samples = []
+        for count in counts:
+            run = lambda: coordinator.render(bounds, ul, lr, count, args.limit,
+                                             args.shortcuts, args.band_rows)
+            sample = settle.sample_from_args(run, args)
+            samples.append((count, sample))
+            line = bench.format_line(args.format, bounds, count, sample.times)
+            print('{}    ({} runs, {} outliers)'.format(line, sample.runs, sample.rejected),
+                  file=sys.stderr)
+            lines.append(line)
+        print('workers lost: {}, bands reissued: {}'.format(coordinator.lost,
+                                                           coordinator.reissued),
+              file=sys.stderr)
+        bench.write_lines(lines, args.output)
+        if args.output:
+            settle.write_metadata(args.output, argv, env, samples)
+    finally:
+        coordinator.close()
+        for process in processes:
+            process.wait()
+        if directory:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main(sys.argv)
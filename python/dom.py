@@ -1,15 +1,90 @@
 from xml.sax.saxutils import escape
 
+# A lightweight stand-in for xml.dom.minidom, just big enough for building
+# slides. Elements hold their children in a plain list, text is kept as
+# ordinary strings, and everything is written straight to an output stream.
+#
+# The output is byte-for-byte what minidom's writexml produces with no
+# indentation: attributes sorted by name, '&', '<', '"' and '>' escaped in
+# both text and attribute values, and childless elements written as '<tag/>'.
+
+quote_entities = { '"': '&quot;' }
+
+def write_data(write, data):
+    if data:
+        write(escape(data, quote_entities))
+
+def write_start(write, tag, attributes):
+    write('<' + tag)
+    for key in sorted(attributes):
+        write(' {}="'.format(key))
+        write_data(write, attributes[key])
+        write('"')
+
+def render(node, output):
+    if isinstance(node, (Element, Raw)):
+        node.render(output)
+    else:
+        write_data(output.write, node)
+
 class Element(object):
-    def __init__(self, tag, attributes, **children):
+    def __init__(self, tag, attributes, *children):
         self.tag = tag
-        self.attributes = attributes
-        self.children = children
+        self.attributes = dict(attributes)
+        self.children = list(children)
+
+    def setAttribute(self, key, value):
+        self.attributes[key] = value
+
+    def appendChild(self, child):
+        self.children.append(child)
+        return child
 
     def render(self, output):
         write = output.write
-        write('<{}'.format(self.tag))
-        if self.attributes:
-            write(' ')
-            for (key, value) in self.attributes.items():
-                
+        write_start(write, self.tag, self.attributes)
+        if self.children:
+            write('>')
+            for child in self.children:
+                render(child, output)
+            write('</{}>'.format(self.tag))
+        else:
+            write('/>')
+
+# Markup that has already been serialized, like an inline SVG picture, to
+# be written out as is among an element's children.
+class Raw(object):
+    def __init__(self, markup):
+        self.markup = markup
+
+    def render(self, output):
+        output.write(self.markup)
+
+# Write a document to output incrementally. Container elements like <html>
+# and <body> are opened with start and closed with end, and complete
+# elements are written with write as soon as they are built, so only one
+# element tree needs to be alive at a time.
+class Writer(object):
+    def __init__(self, output):
+        self.output = output
+        self.open = []
+
+    def doctype(self, name):
+        self.output.write('<?xml version="1.0" ?><!DOCTYPE {}>'.format(name))
+
+    # Elements opened with start are always written with separate start and
+    # end tags; don't use this for elements that might be empty.
+    def start(self, tag, attributes):
+        write_start(self.output.write, tag, attributes)
+        self.output.write('>')
+        self.open.append(tag)
+
+    def end(self):
+        self.output.write('</{}>'.format(self.open.pop()))
+
+    def write(self, node):
+        render(node, self.output)
+
+    # Write markup that has already been serialized, like a cached slide.
+    def raw(self, markup):
+        self.output.write(markup)
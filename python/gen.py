@@ -1,8 +1,36 @@
 # -*- coding: utf-8 -*-
+import argparse
 import codecs
+import sys
 
+from cache import RenderCache
 from slides import *
 
+parser = argparse.ArgumentParser(description='Generate slides.html.')
+parser.add_argument('--jobs', '-j', type=int, default=1, metavar='N',
+                    help='render slides in N worker processes')
+parser.add_argument('--stepped-callouts', action='store_true',
+                    help='step through code callouts within a single slide')
+parser.add_argument('--explorer', metavar='URL',
+                    help='add a live Mandelbrot explorer slide, served from URL '
+                    'by python/tileserver.py (e.g. http://localhost:8001/)')
+parser.add_argument('--stepped-figures', action='store_true',
+                    help='show the squaring and subsets figures as single slides that step '
+                    'through their frames (see svgframes.py)')
+parser.add_argument('--svg-charts', action='store_true',
+                    help='draw the speedup charts as inline SVG from the .data files, '
+                    'instead of showing the PNGs from mandelbrot.gnuplot')
+parser.add_argument('--watch', action='store_true',
+                    help='serve the deck, rebuilding and reloading it on changes')
+parser.add_argument('--port', type=int, default=8000,
+                    help='port for --watch to serve the deck on')
+args = parser.parse_args()
+
+if args.watch:
+    import watch
+    watch.watch([arg for arg in sys.argv[1:] if arg != '--watch'], args.port)
+    sys.exit(0)
+
 pr = Presentation('Concurrency First in Rust', 'Jim Blandy')
 add = pr.add
 
@@ -327,9 +355,12 @@ add(Slide('What does this show?',
                  "We can throw pointers around between threads without fear.",
                  u"Concurrent Rust programs are still non-deterministic, but the non-determinism occurs only at operations designed for it—not just anywhere.").reveal()))
 
-for i in xrange(0, 9):
-    add(Slide('A bit of pure math',
-              Picture('images/squaring-{}.svg'.format(i))))
+if args.stepped_figures:
+    add(SteppedPicture('A bit of pure math', 'images/squaring-frames.svg'))
+else:
+    for i in xrange(0, 9):
+        add(Slide('A bit of pure math',
+                  Picture('images/squaring-{}.svg'.format(i))))
 
 add(Slide('a variation',
           Code("""
@@ -355,8 +386,13 @@ add(Slide('a Complex variation',
 
 # Generated with:
 # ./target/release/mandelbrot ~/rust/amsterdam/images/mandelbrot.png 1024x768 -2.75,1.20 1.25,-1.80
+# or, without the Rust program:
+# python python/mandelbrot.py images/mandelbrot.png 1024x768 -2.75,1.20 1.25,-1.80
 add(BigPicture('images/mandelbrot.png'))
 
+if args.explorer:
+    add(Explorer('exploring the Mandelbrot set', args.explorer))
+
 add(CodeCallout('the Mandelbrot escape calculation', """
     fn escapes(c: Complex<f64>, `limit: u32`2) -> `Option<u32>`1 {
         let mut z = Complex { re: 0.0, im: 0.0 };
@@ -562,13 +598,37 @@ add(Slide('Summing up',
                  "Rust's concurrency primitives are open-ended: when you know what you're doing, you can build new safe primitives from unsafe implementations.",
                  "Benchmark, and you learn cool stuff.").reveal()))
 
-for i in xrange(5):
-    add(BigPicture('images/subsets-{}.svg'.format(i)))
+if args.stepped_figures:
+    add(SteppedPicture(None, 'images/subsets-frames.svg'))
+else:
+    for i in xrange(5):
+        add(BigPicture('images/subsets-{}.svg'.format(i)))
+
+
 
+if args.stepped_callouts:
+    for slide in pr.slides:
+        if isinstance(slide, CodeCallout):
+            slide.stepped()
 
+if args.svg_charts:
+    import charts
+    chart_cache = RenderCache('.chart-cache', '.svg', 'charts')
+    for (i, slide) in enumerate(pr.slides):
+        if isinstance(slide, GnuPlot) and slide.slide in charts.gnuplot_charts:
+            pr.slides[i] = Chart(slide.title,
+                                 charts.cached_draw(charts.gnuplot_charts[slide.slide],
+                                                    chart_cache))
 
+cache = RenderCache('.slide-cache')
 with codecs.open('slides.html', 'w', 'utf-8') as f:
-    pr.render(f)
+    pr.render(f, cache, args.jobs)
+cache.prune()
+cache.report(sys.stdout)
+if args.svg_charts:
+    chart_cache.prune()
+    chart_cache.report(sys.stdout)
+markdown_cache.report('markdown', sys.stdout)
 
 # Local Variables:
 # compile-command: "python python/gen.py"
@@ -0,0 +1,252 @@
+from __future__ import division, print_function
+import argparse
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+# A NumPy version of the Mandelbrot renderer from the talk, for regenerating
+# images/mandelbrot.png and friends without the Rust program. The names and
+# arguments follow the Rust functions shown on the slides, but each function
+# works on whole arrays of pixels at once rather than one pixel at a time.
+#
+# Images are 2-D uint8 arrays indexed [row, column]. Bounds are (width,
+# height) pairs, and points are (re, im) pairs, as in the Rust code.
+
+# Shortcuts escape_times can take to avoid iterating points that will
+# never escape:
+#
+#   cardioid     Points inside the main cardioid or the period-2 bulb are in
+#                the set; recognize them with a closed-form test instead of
+#                iterating them all the way to the limit.
+#   periodicity  Every so often, save each point's z; if z later comes back
+#                to exactly the saved value, the orbit is a cycle and will
+#                never escape. (Brent's method, with the saved value
+#                refreshed at powers of two.) Orbits take a while to settle
+#                into an exact cycle, so checking starts at iteration
+#                periodicity_start; this pays off mostly with higher limits.
+#
+# Neither changes the results: the cardioid tests are strict, and cycles
+# must repeat bit-for-bit, so the escape times are identical to those of
+# the plain loop. See verify.
+all_shortcuts = ('cardioid', 'periodicity')
+
+periodicity_start = 32
+
+# Return a boolean array, true for the points c = c_re + c_im i that lie
+# strictly inside the main cardioid or the period-2 bulb.
+def in_cardioid_or_bulb(c_re, c_im):
+    im2 = c_im * c_im
+    x = c_re - 0.25
+    q = x * x + im2
+    cardioid = q * (q + x) < 0.25 * im2
+    bulb = (c_re + 1.0) * (c_re + 1.0) + im2 < 0.0625
+    return cardioid | bulb
+
+# Return the escape time for each point c = c_re + c_im i, as an int32 array
+# of the same shape: the iteration at which z first had a squared norm
+# greater than 4.0, or -1 if it didn't escape within limit iterations. This
+# is the Rust escapes function, with -1 standing in for None. Shortcuts is
+# a collection of names from all_shortcuts.
+#
+# Points that escape are dropped from the working arrays as they go, so
+# later iterations only do work for the points still in play.
+def escape_times(c_re, c_im, limit, shortcuts=()):
+    shape = np.shape(c_re)
+    times = np.full(shape, -1, dtype=np.int32).ravel()
+    index = np.arange(times.size)
+    c_re = np.array(c_re, dtype=np.float64).ravel()
+    c_im = np.array(c_im, dtype=np.float64).ravel()
+
+    if 'cardioid' in shortcuts:
+        outside = ~in_cardioid_or_bulb(c_re, c_im)
+        index = index[outside]
+        c_re = c_re[outside]
+        c_im = c_im[outside]
+
+    periodicity = 'periodicity' in shortcuts
+    next_save = periodicity_start
+
+    # z = 0 + 0i, and z*z + c computed the same way Complex<f64> does it.
+    z_re = np.zeros_like(c_re)
+    z_im = np.zeros_like(c_im)
+    re2 = np.zeros_like(c_re)
+    im2 = np.zeros_like(c_im)
+    saved_re = z_re
+    saved_im = z_im
+    for i in range(limit):
+        if not index.size:
+            break
+        z_im = z_re * z_im
+        z_im += z_im
+        z_im += c_im
+        z_re = re2 - im2
+        z_re += c_re
+        re2 = z_re * z_re
+        im2 = z_im * z_im
+        escaped = re2 + im2 > 4.0
+        finished = escaped
+        if escaped.any():
+            times[index[escaped]] = i
+
+        if periodicity and i >= periodicity_start:
+            if i > periodicity_start:
+                finished = finished | ((z_re == saved_re) & (z_im == saved_im))
+            if i == next_save:
+                saved_re = z_re.copy()
+                saved_im = z_im.copy()
+                next_save *= 2
+
+        if finished.any():
+            remaining = ~finished
+            index = index[remaining]
+            c_re = c_re[remaining]
+            c_im = c_im[remaining]
+            z_re = z_re[remaining]
+            z_im = z_im[remaining]
+            re2 = re2[remaining]
+            im2 = im2[remaining]
+            if periodicity:
+                saved_re = saved_re[remaining]
+                saved_im = saved_im[remaining]
+
+    return times.reshape(shape)
+
+# Given the column and row of a pixel (or arrays of them), return the
+# corresponding point on the complex plane, as in the Rust pixel_to_point.
+def pixel_to_point(bounds, pixel, ul, lr):
+    (width, height) = (lr[0] - ul[0],
+                       ul[1] - lr[1])
+    return (ul[0] + np.asarray(pixel[0], dtype=np.float64) * width  / bounds[0],
+            ul[1] - np.asarray(pixel[1], dtype=np.float64) * height / bounds[1])
+
+# Convert escape times to gray levels: black for points in the set, and
+# lighter the sooner a point escapes. Limits above 255 would run past the
+# gray levels, so then times are scaled down to fit.
+def shade(times, limit=255):
+    if limit > 255:
+        times = times * 255 // limit
+    return np.where(times < 0, 0, 255 - times).astype(np.uint8)
+
+# Number of rows handed to escape_times at once. Blocks of a few rows keep
+# the working arrays small enough to stay in cache.
+block_rows = 16
+
+# Render rows of the Mandelbrot set into pixels, a 2-D uint8 array of shape
+# (rows, bounds[0]). Its first row is row top of the full bounds[0] by
+# bounds[1] image whose corners are ul and lr, so bands of a larger image
+# can be rendered in place by passing slices of it. To render a narrower
+# rectangle of the image, pass a pixels array with fewer columns, and the
+# index of its first column as left.
+def render(pixels, bounds, ul, lr, top=0, limit=255, shortcuts=(), left=0):
+    columns = np.arange(left, left + pixels.shape[1])
+    for start in range(0, pixels.shape[0], block_rows):
+        rows = np.arange(top + start, top + min(start + block_rows, pixels.shape[0]))
+        (re, _) = pixel_to_point(bounds, (columns, 0), ul, lr)
+        (_, im) = pixel_to_point(bounds, (0, rows), ul, lr)
+        c_re = np.broadcast_to(re, (rows.size, columns.size))
+        c_im = np.broadcast_to(im[:, np.newaxis], (rows.size, columns.size))
+        pixels[start : start + rows.size] = shade(escape_times(c_re, c_im, limit, shortcuts), limit)
+
+# Render the image with and without shortcuts, and return the number of
+# pixels that differ. This should always be zero.
+def verify(bounds, ul, lr, limit, shortcuts):
+    plain = np.empty((bounds[1], bounds[0]), dtype=np.uint8)
+    render(plain, bounds, ul, lr, 0, limit)
+    fast = np.empty_like(plain)
+    render(fast, bounds, ul, lr, 0, limit, shortcuts)
+    return int((plain != fast).sum())
+
+def png_chunk(tag, data):
+    chunk = struct.pack('>I', len(data)) + tag + data
+    return chunk + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+# Return pixels encoded as an 8-bit grayscale PNG. Rows are compressed one
+# at a time, straight from pixels.
+def encode_image(pixels):
+    (height, width) = pixels.shape
+    compressor = zlib.compressobj(6)
+    data = []
+    for row in pixels:
+        # Each row is preceded by its filter type, 0 for none.
+        data.append(compressor.compress(b'\0'))
+        data.append(compressor.compress(row.tobytes()))
+    data.append(compressor.flush())
+    return b''.join([b'\x89PNG\r\n\x1a\n',
+                     png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)),
+                     png_chunk(b'IDAT', b''.join(data)),
+                     png_chunk(b'IEND', b'')])
+
+# Write pixels to filename as an 8-bit grayscale PNG.
+def write_image(filename, pixels):
+    with open(filename, 'wb') as f:
+        f.write(encode_image(pixels))
+
+def parse_pair(s, separator, parse):
+    (first, second) = s.split(separator)
+    return (parse(first), parse(second))
+
+# The regions of the plane the talk's measurements used, as (bounds, upper
+# left, lower right).
+regions = {
+    'mandelbrot': ((1920, 1080), (-1.20, 0.35), (-1, 0.20)),
+    'empty':      ((1920, 1080), (-1.20, 6),    (-1, 5)),
+}
+
+# Parse a comma-separated list of names from all_shortcuts.
+def parse_shortcuts(s):
+    shortcuts = tuple(name for name in s.split(',') if name)
+    for name in shortcuts:
+        if name not in all_shortcuts:
+            raise argparse.ArgumentTypeError('unknown shortcut: ' + name)
+    return shortcuts
+
+# Add options for choosing the image to render to the argparse parser.
+def add_region_arguments(parser):
+    parser.add_argument('--region', choices=sorted(regions), default='mandelbrot',
+                        help='the region to render (default: %(default)s)')
+    parser.add_argument('--size', metavar='WxH',
+                        help="image size in pixels, overriding the region's")
+    parser.add_argument('--upper-left', metavar='RE,IM',
+                        help="upper left corner, overriding the region's; "
+                        "write negative values as --upper-left=-1.2,0.35")
+    parser.add_argument('--lower-right', metavar='RE,IM',
+                        help="lower right corner, overriding the region's")
+    parser.add_argument('--limit', type=int, default=255,
+                        help='iteration limit (default: %(default)s)')
+    parser.add_argument('--shortcuts', type=parse_shortcuts, default=(), metavar='LIST',
+                        help='comma-separated escape time shortcuts to use, from: '
+                        + ', '.join(all_shortcuts))
+
+# Return the (bounds, ul, lr) chosen by the options add_region_arguments
+# added.
+def region_from_args(args):
+    (bounds, ul, lr) = regions[args.region]
+    if args.size:
+        bounds = parse_pair(args.size, 'x', int)
+    if args.upper_left:
+        ul = parse_pair(args.upper_left, ',', float)
+    if args.lower_right:
+        lr = parse_pair(args.lower_right, ',', float)
+    return (bounds, ul, lr)
+
+usage = """\
+Usage: mandelbrot.py FILE PIXELS UPPERLEFT LOWERRIGHT
+Example: mandelbrot.py mandel.png 1920x1080 -1.20,0.35 -1,0.20"""
+
+def main(argv):
+    if len(argv) != 5:
+        print(usage, file=sys.stderr)
+        sys.exit(1)
+
+    bounds = parse_pair(argv[2], 'x', int)
+    ul = parse_pair(argv[3], ',', float)
+    lr = parse_pair(argv[4], ',', float)
+
+    pixels = np.zeros((bounds[1], bounds[0]), dtype=np.uint8)
+    render(pixels, bounds, ul, lr)
+    write_image(argv[1], pixels)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,516 @@
+from __future__ import division, print_function
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import mmap
+import multiprocessing
+import os
+import queue
+import random
+import signal
+import sys
+import timeit
+
+import numpy as np
+
+import bench
+import settle
+
+# A parallel grep, after the talk's pgrep: a pool of workers searches the
+# files, and sends what it finds back over a channel to the main thread,
+# which prints it. As in the Rust, there are two kinds of message:
+#
+#   ('hit', index, lines)          lines, a list of byte strings, matched in
+#                                  the index'th file
+#   ('done', index, size, error)   the index'th file has been searched; size
+#                                  is the number of bytes searched, and error
+#                                  is None, or a message saying what went wrong
+#
+# Hits are sent in batches of up to batch_lines lines, rather than one
+# message per line, since each message costs a lock round trip, or with
+# processes, a pickle and a pipe write.
+#
+# Unlike the Rust channel, the results queue is bounded: if the main thread
+# falls behind printing, the workers block instead of piling up matches in
+# memory. That doesn't hold when printing in file order (see Printer),
+# which has to keep the matches from later files until their turn comes.
+#
+# Rather than reading lines and decoding each one to search it, as the
+# talk's BufReader::lines loop does, workers map each file into memory and
+# look for the pattern's bytes with mmap.find, only cutting out the lines
+# around the matches. The talk's loop is still here, as the 'lines' mode,
+# for comparison; 'python python/pgrep.py bench' compares the modes on a
+# generated corpus.
+#
+# With thousands of small files, the time goes to opening and reading them
+# rather than searching, and a pool worker spends most of its life waiting
+# on one open or read at a time. The 'async' mode (see scan_async) instead
+# keeps many files in flight from an asyncio event loop.
+
+default_jobs = 8
+default_queue_size = 64
+batch_lines = 256
+
+# The async mode's default number of files to read per executor call.
+default_batch_files = 16
+
+# The async mode reads files up to this size whole; larger ones are
+# searched with search, in the executor.
+small_file_bytes = 1024 * 1024
+
+# Yield the lines in data, a bytes-like object of size bytes supporting find
+# and rfind, such as bytes or an mmap, that contain pattern, a byte string,
+# without their line endings. An empty pattern matches every line.
+def find_lines(data, size, pattern):
+    position = data.find(pattern)
+    # An empty pattern is found at the very end, even when searching from
+    # past it, so a match must start before the end to be a line.
+    while 0 <= position < size:
+        start = data.rfind(b'\n', 0, position) + 1
+        end = data.find(b'\n', position)
+        if end < 0:
+            end = size
+        yield data[start:end]
+        position = data.find(pattern, end + 1)
+
+# Yield the lines in the file at path that contain pattern, a byte string,
+# without their line endings.
+def search(path, pattern):
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        # Empty files can't be mapped.
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            for line in find_lines(m, size, pattern):
+                yield line
+
+# Search the index'th file, at path, for pattern, sending hits and then a
+# done message to results, a queue. Only errors searching the file are
+# reported in the done message; errors from results.put, like a broken pipe
+# when results is a Printer, are left to the caller. The done message is
+# sent whatever happens, so the Printer is never left waiting for it.
+def grep(index, path, pattern, results):
+    size = 0
+    error = None
+    found = iter(())
+    try:
+        size = os.path.getsize(path)
+        found = search(path, pattern)
+    except OSError as e:
+        error = str(e)
+    try:
+        while True:
+            try:
+                lines = list(itertools.islice(found, batch_lines))
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                break
+            if not lines:
+                break
+            results.put(('hit', index, lines))
+    finally:
+        results.put(('done', index, size, error))
+
+# The results queue of a process pool worker, set by start_worker.
+worker_results = None
+
+# Leave interrupts to the main process, which shuts the pool down.
+def start_worker(results):
+    global worker_results
+    worker_results = results
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def grep_in_worker(job):
+    (index, path, pattern) = job
+    grep(index, path, pattern, worker_results)
+
+# Print the messages from the workers to output, a binary file, and keep
+# count of what was found.
+#
+# If order is 'found', print hits as they arrive, so lines from different
+# files may be interleaved. If order is 'file', print each file's hits
+# together, with the files in the order given: hits from files later in
+# the list are held until the files before them are done. Held hits are
+# kept in memory without limit, since the Printer can't stop taking
+# results without also stopping the worker on the file it's waiting for;
+# so with a slow first file, order 'file' may hold nearly all the matches.
+#
+# Like grep, put the file name in front of each line if there is more than
+# one file.
+#
+# The counts of files and bytes searched, with the time since the Printer
+# was made, give the scan's throughput; see report.
+class Printer(object):
+    def __init__(self, files, output, order='found'):
+        self.files = files
+        self.output = output
+        self.order = order
+        self.prefixes = [os.fsencode(path) + b':' if len(files) > 1 else b''
+                         for path in files]
+        self.held = {}
+        self.finished = set()
+        self.next = 0
+        self.hits = 0
+        self.searched = 0
+        self.bytes = 0
+        self.errors = 0
+        self.start = timeit.default_timer()
+
+    def hit(self, index, lines):
+        self.hits += len(lines)
+        if self.order == 'file' and index != self.next:
+            self.held.setdefault(index, []).extend(lines)
+        else:
+            self.write(index, lines)
+
+    def done(self, index, size, error):
+        self.searched += 1
+        self.bytes += size
+        if error is not None:
+            self.errors += 1
+            print('Error searching {}: {}'.format(self.files[index], error), file=sys.stderr)
+        if self.order == 'file':
+            self.finished.add(index)
+            while self.next in self.finished:
+                self.finished.remove(self.next)
+                self.next += 1
+                if self.next in self.held:
+                    self.write(self.next, self.held.pop(self.next))
+
+    # Handle a message. Printers take messages as queues do, so that
+    # scan_serial can hand one straight to grep.
+    def put(self, message):
+        if message[0] == 'hit':
+            self.hit(*message[1:])
+        else:
+            self.done(*message[1:])
+
+    def write(self, index, lines):
+        prefix = self.prefixes[index]
+        self.output.write(b''.join(prefix + line + b'\n' for line in lines))
+
+    # Take messages from results, a queue, until every file is done.
+    def drain(self, results):
+        while self.searched < len(self.files):
+            self.put(results.get())
+
+    def elapsed(self):
+        return timeit.default_timer() - self.start
+
+    def report(self, file):
+        seconds = self.elapsed()
+        print('searched {} files, {:.1f} MB in {:.3f}s: {:.0f} files/s, {:.1f} MB/s; '
+              '{} matching lines, {} errors'.format(
+                  self.searched, self.bytes / 1e6, seconds, self.searched / seconds,
+                  self.bytes / 1e6 / seconds, self.hits, self.errors), file=file)
+
+# The talk's single-threaded loop: read each file a line at a time,
+# decoding as it goes, and print the lines containing pattern.
+def scan_lines(files, pattern, printer):
+    text = pattern.decode('utf-8')
+    for (index, path) in enumerate(files):
+        size = 0
+        error = None
+        lines = []
+        try:
+            size = os.path.getsize(path)
+            with open(path, encoding='utf-8', errors='surrogateescape') as f:
+                for line in f:
+                    if text in line:
+                        lines.append(line.rstrip('\n').encode('utf-8', 'surrogateescape'))
+        except OSError as e:
+            error = str(e)
+        if lines:
+            printer.hit(index, lines)
+        printer.done(index, size, error)
+
+# Search each file in turn in this thread, with search.
+def scan_serial(files, pattern, printer):
+    for (index, path) in enumerate(files):
+        grep(index, path, pattern, printer)
+
+# Search the files on a pool of jobs threads. Python bytes searches don't
+# release the GIL, so this mostly helps when reading the files is slow.
+#
+# If printing fails, as when the output is a pipe whose reader has gone, the
+# workers still have to stop before the pool can be shut down: files not yet
+# started are cancelled, and results are taken and thrown away until the
+# running workers finish, so none is left blocked on a full queue.
+def scan_threads(files, pattern, printer, jobs=default_jobs,
+                 queue_size=default_queue_size):
+    results = queue.Queue(queue_size)
+    with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+        futures = [pool.submit(grep, index, path, pattern, results)
+                   for (index, path) in enumerate(files)]
+        try:
+            printer.drain(results)
+        except BaseException:
+            running = [future for future in futures if not future.cancel()]
+            while not all(future.done() for future in running):
+                try:
+                    results.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            raise
+
+# Read each (index, path) pair in batch, and return a list of triples
+# (index, data, error), where data is the file's contents, or its size if
+# it's too large to read whole, and error is None or a message.
+def read_batch(batch):
+    read = []
+    for (index, path) in batch:
+        try:
+            with open(path, 'rb', buffering=0) as f:
+                size = os.fstat(f.fileno()).st_size
+                read.append((index, f.readall() if size <= small_file_bytes else size, None))
+        except OSError as e:
+            read.append((index, 0, str(e)))
+    return read
+
+# Search the large file at path in the executor, and return the matching
+# lines and the size searched.
+def search_large(path, pattern):
+    return list(search(path, pattern))
+
+# Search the files from an asyncio event loop, with up to batches batches
+# of files being read at once on a pool of jobs threads. If batches is
+# None, there is one for each thread; with fewer, some threads sit idle.
+#
+# Files are read in batches of batch_files, one executor call per batch,
+# since for small files the cost of handing a call to a thread and getting
+# the result back is comparable to the read itself. A batch's files are
+# read one after another, so batches is also the most files open at once.
+# Each of batches tasks reads a batch, and then, while the other tasks'
+# reads proceed, searches the data on the event loop's thread, so reading
+# and searching overlap. Files too large to read whole are searched in the
+# executor with search, as the other modes do.
+async def scan_batches(files, pattern, printer, jobs, batches, batch_files):
+    loop = asyncio.get_running_loop()
+    jobs_left = iter(range(0, len(files), batch_files))
+
+    async def task(executor):
+        for first in jobs_left:
+            batch = list(enumerate(files[first : first + batch_files], first))
+            for (index, data, error) in await loop.run_in_executor(executor, read_batch,
+                                                                   batch):
+                if isinstance(data, bytes):
+                    lines = list(find_lines(data, len(data), pattern))
+                    size = len(data)
+                elif error is None:
+                    size = data
+                    try:
+                        lines = await loop.run_in_executor(executor, search_large,
+                                                           files[index], pattern)
+                    except (OSError, ValueError) as e:
+                        (lines, error) = ([], str(e))
+                else:
+                    (lines, size) = ([], 0)
+                if lines:
+                    printer.hit(index, lines)
+                printer.done(index, size, error)
+
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        await asyncio.gather(*[task(executor) for _ in range(batches or jobs)])
+
+def scan_async(files, pattern, printer, jobs=default_jobs, batches=None,
+               batch_files=default_batch_files):
+    asyncio.run(scan_batches(files, pattern, printer, jobs, batches, batch_files))
+
+# Search the files on a pool of jobs processes.
+def scan_processes(files, pattern, printer, jobs=default_jobs,
+                   queue_size=default_queue_size):
+    results = multiprocessing.Queue(queue_size)
+    pool = multiprocessing.Pool(jobs, initializer=start_worker, initargs=(results,))
+    try:
+        pool.map_async(grep_in_worker,
+                       [(index, path, pattern) for (index, path) in enumerate(files)])
+        printer.drain(results)
+    finally:
+        pool.terminate()
+        pool.join()
+
+# Search files, a list of paths, for pattern, a byte string, printing the
+# matching lines to output, and return the Printer, which has the counts.
+# See Printer for order.
+#
+# The async mode's batches and batch_files are described at scan_batches.
+def scan(files, pattern, output, mode='threads', jobs=default_jobs,
+         queue_size=default_queue_size, order='found', batches=None,
+         batch_files=default_batch_files):
+    printer = Printer(files, output, order)
+    if mode == 'lines':
+        scan_lines(files, pattern, printer)
+    elif mode == 'serial':
+        scan_serial(files, pattern, printer)
+    elif mode == 'threads':
+        scan_threads(files, pattern, printer, jobs, queue_size)
+    elif mode == 'async':
+        scan_async(files, pattern, printer, jobs, batches, batch_files)
+    else:
+        scan_processes(files, pattern, printer, jobs, queue_size)
+    return printer
+
+modes = ['lines', 'serial', 'threads', 'processes', 'async']
+
+# The modes that take a number of jobs.
+pooled_modes = ['threads', 'processes', 'async']
+
+# Words for the generated corpus, and the word planted in some of its lines
+# for the benchmark to find.
+corpus_words = ('the quick brown fox jumps over lazy dog thread pool channel sender '
+                'receiver message scope borrow mutex atomic band pixel render').split()
+needle = 'needle'
+needle_rate = 0.01
+
+# Fill directory with count text files of about size bytes each, unless it
+# already holds the same corpus, and return their paths.
+def make_corpus(directory, count, size, seed=0):
+    paths = [os.path.join(directory, 'file-{:05}.txt'.format(i)) for i in range(count)]
+    manifest = os.path.join(directory, 'MANIFEST')
+    description = '{} {} {}\n'.format(count, size, seed)
+    try:
+        with open(manifest) as f:
+            if f.read() == description:
+                return paths
+    except OSError:
+        pass
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    generator = random.Random(seed)
+    for path in paths:
+        lines = []
+        written = 0
+        while written < size:
+            words = generator.choices(corpus_words, k=10)
+            if generator.random() < needle_rate:
+                words[generator.randrange(len(words))] = needle
+            line = ' '.join(words) + '\n'
+            lines.append(line)
+            written += len(line)
+        with open(path, 'w') as f:
+            f.write(''.join(lines))
+    with open(manifest, 'w') as f:
+        f.write(description)
+    return paths
+
+# Time each mode searching files for pattern, with each count of jobs for
+# the pooled modes, and print a table. Return False if the modes disagree
+# about the number of matching lines. Options is a dictionary of keyword
+# arguments for scan.
+def compare(files, pattern, modes, counts, options, args):
+    print('{:10} {:>4} {:>10} {:>8} {:>8} {:>8}'.format('mode', 'jobs', 'median ms',
+                                                       'files/s', 'MB/s', 'hits'))
+    found = set()
+    with open(os.devnull, 'wb') as null:
+        for mode in modes:
+            for jobs in (counts if mode in pooled_modes else [1]):
+                printers = []
+                def run():
+                    printers.append(scan(files, pattern, null, mode, jobs, **options))
+                sample = settle.sample_from_args(run, args)
+                median = float(np.median(sample.times))
+                printer = printers[-1]
+                found.add(printer.hits)
+                print('{:10} {:4} {:10.1f} {:8.0f} {:8.1f} {:8}'.format(
+                    mode, jobs, median * 1000, printer.searched / median,
+                    printer.bytes / median / 1e6, printer.hits))
+    return len(found) == 1
+
+# An argparse type for counts that must be at least one.
+def positive(s):
+    n = int(s)
+    if n < 1:
+        raise argparse.ArgumentTypeError('expected a positive number, not ' + s)
+    return n
+
+def add_async_arguments(parser):
+    parser.add_argument('--batches', type=positive, metavar='N',
+                        help='with --mode async, batches of files to be reading at once; '
+                        'fewer than --jobs leaves threads idle (default: one per job)')
+    parser.add_argument('--batch-files', type=positive, default=default_batch_files,
+                        metavar='N',
+                        help='with --mode async, files to read per executor call, one '
+                        'after another (default: %(default)s)')
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Search files for lines containing a string, in parallel.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    find = commands.add_parser('search', help='print the lines of FILES containing PATTERN')
+    find.add_argument('pattern', metavar='PATTERN')
+    find.add_argument('files', nargs='+', metavar='FILE')
+    find.add_argument('--mode', choices=modes, default='threads',
+                      help='how to search the files (default: %(default)s)')
+    find.add_argument('--jobs', '-j', type=int, default=default_jobs, metavar='N',
+                      help='threads or processes to search with (default: %(default)s)')
+    find.add_argument('--queue-size', type=int, default=default_queue_size, metavar='N',
+                      help='results that may wait to be printed before workers block '
+                      '(default: %(default)s)')
+    find.add_argument('--order', choices=['found', 'file'], default='found',
+                      help="print lines as they're found, or grouped by file in "
+                      'command-line order, holding later files\' lines in memory '
+                      '(default: %(default)s)')
+    add_async_arguments(find)
+    find.add_argument('--stats', action='store_true',
+                      help='print the files and bytes searched per second to standard error')
+
+    measure = commands.add_parser(
+        'bench', help='compare the search modes on a generated corpus')
+    measure.add_argument('--corpus', default='.pgrep-corpus', metavar='DIR',
+                         help='directory to generate the corpus in (default: %(default)s)')
+    measure.add_argument('--files', type=int, default=200, metavar='N',
+                         help='number of files in the corpus (default: %(default)s)')
+    measure.add_argument('--size', type=int, default=256, metavar='KB',
+                         help='size of each file, in kilobytes (default: %(default)s)')
+    measure.add_argument('--modes', default=','.join(modes), metavar='LIST',
+                         help='modes to compare (default: %(default)s)')
+    measure.add_argument('--counts', default='1,2,4,8', metavar='LIST',
+                         help='job counts to try for the pooled modes, like 1-8 '
+                         '(default: %(default)s)')
+    measure.add_argument('--queue-size', type=int, default=default_queue_size, metavar='N',
+                         help='results queue size (default: %(default)s)')
+    add_async_arguments(measure)
+    settle.add_arguments(measure)
+    args = parser.parse_args(argv[1:])
+
+    if args.command == 'search':
+        output = sys.stdout.buffer
+        try:
+            printer = scan(args.files, os.fsencode(args.pattern), output, args.mode,
+                           args.jobs, args.queue_size, args.order, args.batches,
+                           args.batch_files)
+            output.flush()
+        except BrokenPipeError:
+            # Whatever was reading the output has stopped, as with head, so
+            # stop quietly, as grep does. Point standard output at the null
+            # device, so flushing it on the way out doesn't fail again.
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            sys.exit(1)
+        if args.stats:
+            printer.report(sys.stderr)
+        # Like grep: 0 if anything matched, 1 if not, 2 on errors.
+        sys.exit(2 if printer.errors else 0 if printer.hits else 1)
+
+    selected = args.modes.split(',')
+    for mode in selected:
+        if mode not in modes:
+            sys.exit('unknown mode: {}'.format(mode))
+    env = settle.environment()
+    print('\n'.join(settle.summary(env)), file=sys.stderr)
+    if args.strict and settle.warnings(env):
+        sys.exit('machine is too noisy to benchmark; see the warnings above')
+    files = make_corpus(args.corpus, args.files, args.size * 1024)
+    options = { 'queue_size': args.queue_size,
+                'batches': args.batches,
+                'batch_files': args.batch_files }
+    if not compare(files, needle.encode('ascii'), selected,
+                   bench.parse_counts(args.counts), options, args):
+        sys.exit('modes found different numbers of matching lines')
+
+if __name__ == '__main__':
+    main(sys.argv)
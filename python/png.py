@@ -0,0 +1,121 @@
+from __future__ import division, print_function
+import struct
+import zlib
+
+import numpy as np
+
+from mandelbrot import png_chunk
+
+# Write PNG files a band of rows at a time, as the bands are rendered,
+# instead of encoding the whole image at the end.
+#
+# A PNG's pixels are a single zlib stream, split across IDAT chunks, of the
+# rows with a filter type byte in front of each. Here, each band is
+# filtered and compressed on its own, by encode_band, which can run in the
+# worker process that rendered the band:
+#
+# - Each row gets whichever of the None, Sub and Up filters makes its bytes
+#   smallest in absolute value, the usual heuristic. A band's first row
+#   can't use Up, since the row above it belongs to another band.
+#
+# - Each band is compressed as raw deflate data, ended with a sync flush,
+#   which leaves it on a byte boundary, so bands can simply be
+#   concatenated. The deflate dictionary starts afresh with each band,
+#   which costs a little compression.
+#
+# StreamWriter puts the bands in order as they arrive, writes each as its
+# own IDAT chunk, and supplies the zlib header, the final block, and the
+# Adler-32 checksum, combined from the bands' checksums so the parent
+# process never has to look at the pixels.
+
+level = 6
+
+# The zlib stream header for 32k windows, level 6.
+zlib_header = b'\x78\x9c'
+
+adler_base = 65521
+
+# Return the Adler-32 checksum of the concatenation of two byte strings,
+# given the checksum of each and the length of the second; zlib's
+# adler32_combine.
+def adler32_combine(adler1, adler2, length2):
+    remainder = length2 % adler_base
+    sum1 = adler1 & 0xffff
+    sum2 = remainder * sum1 % adler_base
+    sum1 = (sum1 + (adler2 & 0xffff) + adler_base - 1) % adler_base
+    sum2 = (sum2 + (adler1 >> 16) + (adler2 >> 16) + adler_base - remainder) % adler_base
+    return (sum2 << 16) | sum1
+
+# Return rows, a 2-D uint8 array, filtered for PNG: a uint8 array with an
+# extra leading column holding each row's filter type.
+def filter_rows(rows):
+    (height, width) = rows.shape
+    sub = rows.copy()
+    sub[:, 1:] -= rows[:, :-1]
+    up = rows.copy()
+    up[1:] -= rows[:-1]
+    candidates = np.stack([rows, sub, up])
+
+    # Compare the filters by the sum of their bytes taken as signed.
+    costs = np.abs(candidates.view(np.int8).astype(np.int32)).sum(axis=2)
+    costs[2, 0] = np.iinfo(np.int32).max
+    choices = costs.argmin(axis=0)
+
+    filtered = np.empty((height, width + 1), dtype=np.uint8)
+    filtered[:, 0] = choices
+    filtered[:, 1:] = candidates[choices, np.arange(height)]
+    return filtered
+
+# Filter and compress the rows of a band, a 2-D uint8 array, and return a
+# triple (data, adler, length): the raw deflate data, and the Adler-32
+# checksum and length of the filtered bytes it holds.
+def encode_band(rows):
+    filtered = filter_rows(rows).tobytes()
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    data = compressor.compress(filtered) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return (data, zlib.adler32(filtered) & 0xffffffff, len(filtered))
+
+# Write a grayscale PNG with the given bounds to file, a binary file
+# object, from bands encoded by encode_band, which may arrive in any
+# order. Only the encoded bands that arrive ahead of their turn are held
+# in memory.
+class StreamWriter(object):
+    def __init__(self, file, bounds):
+        self.file = file
+        self.bounds = bounds
+        self.row = 0
+        self.waiting = {}
+        self.adler = 1
+        file.write(b'\x89PNG\r\n\x1a\n')
+        file.write(png_chunk(b'IHDR', struct.pack('>IIBBBBB', bounds[0], bounds[1],
+                                                  8, 0, 0, 0, 0)))
+        file.write(png_chunk(b'IDAT', zlib_header))
+
+    # Add the band of rows rows starting at row top, encoded by encode_band,
+    # and write out whatever bands are now in order.
+    def add(self, top, rows, encoded):
+        self.waiting[top] = (rows, encoded)
+        while self.row in self.waiting:
+            (rows, (data, adler, length)) = self.waiting.pop(self.row)
+            self.file.write(png_chunk(b'IDAT', data))
+            self.adler = adler32_combine(self.adler, adler, length)
+            self.row += rows
+
+    def close(self):
+        if self.row != self.bounds[1]:
+            raise ValueError('PNG stream ended at row {} of {}'.format(self.row,
+                                                                     self.bounds[1]))
+        # An empty final block, and the checksum.
+        end = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS).flush()
+        self.file.write(png_chunk(b'IDAT', end + struct.pack('>I', self.adler)))
+        self.file.write(png_chunk(b'IEND', b''))
+
+# Write pixels to filename as a PNG, one band of band_rows rows at a time.
+def write_image(filename, pixels, band_rows=64):
+    (height, width) = pixels.shape
+    with open(filename, 'wb') as f:
+        writer = StreamWriter(f, (width, height))
+        for top in range(0, height, band_rows):
+            band = pixels[top : top + band_rows]
+            writer.add(top, band.shape[0], encode_band(band))
+        writer.close()
@@ -0,0 +1,204 @@
+from __future__ import division, print_function
+import collections
+import json
+import math
+import os
+import platform
+import subprocess
+import timeit
+
+import numpy as np
+
+# Keep benchmark noise down, and record what the machine was doing, in
+# place of the 'moz settle-down' command the original .data files were
+# collected under, which set every CPU to the 'performance' governor and
+# paused programs like Firefox and Emacs.
+#
+# This can't pause other programs, but it can report on them: environment
+# gathers the CPU governors and frequencies from sysfs, the load average
+# and the CPUs this process may run on, and warnings points out anything
+# that is likely to make measurements noisy. sample then times a benchmark
+# with warmup runs, rejects outliers, and keeps going until the median is
+# known precisely enough.
+
+cpu_directory = '/sys/devices/system/cpu'
+
+# Load averages above this suggest something else is competing for CPUs.
+busy_load = 0.5
+
+def read_sysfs(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+# Return a list of the CPUs this process may run on.
+def allowed_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+# Restrict the calling process to the index'th CPU in cpus, wrapping around
+# if there are fewer CPUs than that. Do nothing where affinity isn't
+# supported.
+def pin(cpus, index):
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, { cpus[index % len(cpus)] })
+
+def git_commit():
+    try:
+        with open(os.devnull, 'w') as null:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                           stderr=null).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Return an ordered dictionary describing the machine and its current
+# state, for recording alongside measurements.
+def environment():
+    cpus = allowed_cpus()
+    governors = collections.OrderedDict()
+    frequencies = collections.OrderedDict()
+    for cpu in cpus:
+        directory = os.path.join(cpu_directory, 'cpu{}'.format(cpu), 'cpufreq')
+        governors[cpu] = read_sysfs(os.path.join(directory, 'scaling_governor'))
+        khz = [read_sysfs(os.path.join(directory, name))
+               for name in ('scaling_cur_freq', 'scaling_min_freq', 'scaling_max_freq')]
+        frequencies[cpu] = [int(k) // 1000 if k else None for k in khz]
+
+    no_turbo = read_sysfs(os.path.join(cpu_directory, 'intel_pstate', 'no_turbo'))
+    boost = read_sysfs(os.path.join(cpu_directory, 'cpufreq', 'boost'))
+    if no_turbo is not None:
+        turbo = no_turbo == '0'
+    elif boost is not None:
+        turbo = boost == '1'
+    else:
+        turbo = None
+
+    return collections.OrderedDict([
+        ('commit', git_commit()),
+        ('platform', platform.platform()),
+        ('processor', platform.processor() or platform.machine()),
+        ('python', platform.python_version()),
+        ('numpy', np.__version__),
+        ('cpu_count', os.cpu_count()),
+        ('allowed_cpus', cpus),
+        ('load_average', list(os.getloadavg()) if hasattr(os, 'getloadavg') else None),
+        ('governors', governors),
+        # [current, minimum, maximum] frequency of each CPU, in MHz.
+        ('frequencies_mhz', frequencies),
+        ('turbo', turbo),
+    ])
+
+# Return a list of reasons to distrust measurements taken in env, a
+# dictionary returned by environment.
+def warnings(env):
+    found = []
+    governors = set(env['governors'].values())
+    if governors == {None}:
+        found.append('CPU governors unavailable (no cpufreq in sysfs)')
+    elif governors != {'performance'}:
+        found.append('CPU governors are {}, not performance'.format(
+            ', '.join(sorted(str(g) for g in governors))))
+    if env['turbo']:
+        found.append('turbo boost is enabled')
+    if env['load_average'] and env['load_average'][0] > busy_load:
+        found.append('load average is {:.2f}'.format(env['load_average'][0]))
+    return found
+
+# Return the indices of the order statistics that bound a confidence
+# interval for the median of n sorted samples, at about 95% confidence,
+# using the normal approximation to the binomial distribution.
+def median_interval(n):
+    half = 1.96 * math.sqrt(n) / 2
+    return (max(0, int(math.floor(n / 2 - half))),
+            min(n - 1, int(math.ceil(n / 2 + half))))
+
+# Return a boolean array, true for the samples in times that lie within
+# Tukey's fences: no more than 1.5 times the interquartile range outside
+# the quartiles.
+def inliers(times):
+    (q1, q3) = np.percentile(times, [25, 75])
+    spread = 1.5 * (q3 - q1)
+    return (times >= q1 - spread) & (times <= q3 + spread)
+
+# The results of sample.
+Sample = collections.namedtuple('Sample', 'times rejected runs interval')
+
+# Time calls to run, which takes no arguments, and return a Sample whose
+# times are the kept times in seconds, rejected is the number of outliers
+# dropped, runs is the number of timed calls, and interval is a (low,
+# high) confidence interval for the median of times.
+#
+# First call run warmup times untimed. Then time at least repeat calls,
+# and keep going until the confidence interval's half-width is at most
+# target times the median, or max_repeat calls have been timed. A target
+# of zero means exactly repeat calls.
+def sample(run, repeat=5, warmup=1, target=0.02, max_repeat=50):
+    for _ in range(warmup):
+        run()
+
+    times = []
+    while True:
+        start = timeit.default_timer()
+        run()
+        times.append(timeit.default_timer() - start)
+        if len(times) < repeat:
+            continue
+
+        all_times = np.array(times)
+        kept = np.sort(all_times[inliers(all_times)])
+        (low, high) = median_interval(len(kept))
+        interval = (float(kept[low]), float(kept[high]))
+        precise = interval[1] - interval[0] <= 2 * target * float(np.median(kept))
+        if not target or precise or len(times) >= max_repeat:
+            return Sample(kept, len(times) - len(kept), len(times), interval)
+
+# Write env and per-count sampling details to a JSON file next to the
+# .data file named output: mandelbrot.data gets mandelbrot.data.json.
+def write_metadata(output, argv, env, samples):
+    metadata = collections.OrderedDict([
+        ('command', ['python'] + list(argv)),
+        ('environment', env),
+        ('warnings', warnings(env)),
+        ('samples', collections.OrderedDict(
+            (str(count), collections.OrderedDict([
+                ('runs', s.runs),
+                ('rejected', s.rejected),
+                ('median', float(np.median(s.times))),
+                ('interval', list(s.interval)),
+            ]))
+            for (count, s) in samples)),
+    ])
+    with open(output + '.json', 'w') as f:
+        json.dump(metadata, f, indent=2)
+        f.write('\n')
+
+# Return comment lines summarizing env and its warnings, for the header of
+# a .data file.
+def summary(env):
+    governors = sorted(set(str(g) for g in env['governors'].values()))
+    load = env['load_average'] and '{:.2f}'.format(env['load_average'][0])
+    lines = ['# environment: commit {}, {} CPUs allowed, governors {}, load {}'.format(
+        env['commit'], len(env['allowed_cpus']), '/'.join(governors), load)]
+    lines.extend('# warning: ' + warning for warning in warnings(env))
+    return lines
+
+def add_arguments(parser):
+    parser.add_argument('--repeat', type=int, default=5, metavar='N',
+                        help='timed renders per worker count, at least (default: %(default)s)')
+    parser.add_argument('--max-repeat', type=int, default=50, metavar='N',
+                        help='timed renders per worker count, at most (default: %(default)s)')
+    parser.add_argument('--warmup', type=int, default=1, metavar='N',
+                        help='untimed renders before timing (default: %(default)s)')
+    parser.add_argument('--target', type=float, default=0.02, metavar='FRACTION',
+                        help="repeat until the median's 95%% confidence interval is within "
+                        "this fraction of it, or 0 to stop after --repeat renders "
+                        '(default: %(default)s)')
+    parser.add_argument('--strict', action='store_true',
+                        help='refuse to run if the machine looks noisy (see warnings)')
+
+# Call sample with the options add_arguments added.
+def sample_from_args(run, args):
+    return sample(run, args.repeat, args.warmup, args.target, args.max_repeat)
@@ -1,7 +1,12 @@
 from __future__ import print_function
+import collections
+import itertools
+import multiprocessing
 import re
 import sys
-import xml.dom
+from StringIO import StringIO
+
+from dom import Element, Raw, Writer
 
 leading_whitespace = re.compile(r'^\s*')
 
@@ -31,27 +36,68 @@ def clean_text(text):
 
 markdown_pattern = re.compile(r'(\*([^*]+)\*)|(`([^`]+)`)')
 
-def dumb_markdown(pres, text):
-    elt = pres.elt
+# Parse the inline markup in text into a tuple of (tag, text) pairs, where
+# tag is 'b' for *bold*, 'code' for `code`, or None for plain text.
+def parse_markdown(text):
     spans = []
     last_end = 0
     for match in markdown_pattern.finditer(text):
         if last_end < match.start():
-            spans.append(pres.doc.createTextNode(text[last_end : match.start()]))
+            spans.append((None, text[last_end : match.start()]))
 
         if match.group(1):  # bold
-            e = elt('b', {}, match.group(2))
+            spans.append(('b', match.group(2)))
         elif match.group(3):  # tt
-            e = elt('code', {}, match.group(4))
-        assert e
+            spans.append(('code', match.group(4)))
 
-        spans.append(e)
         last_end = match.end()
 
     if last_end < len(text):
-        spans.append(pres.doc.createTextNode(text[last_end : ]))
+        spans.append((None, text[last_end : ]))
+
+    return tuple(spans)
+
+# A dictionary holding at most size entries, discarding the least recently
+# used entry to make room for new ones.
+class LRUCache(object):
+    def __init__(self, size):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # Return the value cached for key, calling compute(key) to produce it if
+    # it isn't present.
+    def get(self, key, compute):
+        try:
+            value = self.entries.pop(key)
+            self.hits += 1
+        except KeyError:
+            value = compute(key)
+            self.misses += 1
+            if len(self.entries) >= self.size:
+                self.entries.popitem(last=False)
+        self.entries[key] = value
+        return value
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    def report(self, name, file):
+        print('{}: {} hits, {} misses ({:.0%} hit rate)'
+              .format(name, self.hits, self.misses, self.hit_rate()),
+              file=file)
+
+# Titles, points and paragraphs repeat across many slides, so each distinct
+# string is only parsed once per build. Worker processes each have their
+# own cache.
+markdown_cache = LRUCache(1024)
 
-    return spans
+def dumb_markdown(pres, text):
+    elt = pres.elt
+    return [elt(tag, {}, content) if tag else content
+            for (tag, content) in markdown_cache.get(text, parse_markdown)]
 
 class Presentation(object):
     def __init__(self, title, author):
@@ -63,55 +109,102 @@ class Presentation(object):
         self.slides.append(slide)
 
     def elt(self, tag, attributes, *children):
-        e = self.doc.createElement(tag)
-        for (key, value) in attributes.items():
-            e.setAttribute(key, value)
-        for child in children:
-            if isinstance(child, str) or isinstance(child, unicode):
-                child = self.doc.createTextNode(unicode(child))
-            e.appendChild(child)
         # Hack for HTML weirdness.
-        if tag == 'script' and not children:
-            e.appendChild(self.doc.createTextNode(''))
-        return e
-
-    def render(self, output):
-        impl = xml.dom.getDOMImplementation()
-        self.doc = impl.createDocument('', 'html', impl.createDocumentType('HTML', '', ''))
-        self.root = self.doc.documentElement
-        self.root.setAttribute('lang', 'en')
+        if tag in ('script', 'iframe') and not children:
+            children = ('',)
+        return Element(tag, attributes, *children)
+
+    # Render slide's section or sections to writer.
+    def render_slide(self, slide, writer):
+        render = slide.render(self)
+        if isinstance(render, list):
+            for subslide in render:
+                writer.write(subslide)
+        else:
+            writer.write(render)
+
+    # Return slide's rendered markup as a string.
+    def render_fragment(self, slide):
+        buf = StringIO()
+        self.render_slide(slide, Writer(buf))
+        return buf.getvalue()
+
+    # Yield the rendered markup for each slide, in order. If cache is a
+    # cache.RenderCache, take markup from it where possible, and render only
+    # those slides that have changed since the last build. If jobs is
+    # greater than one, render slides in that many worker processes.
+    def fragments(self, cache=None, jobs=1):
+        if cache is None:
+            keys = [None] * len(self.slides)
+            missing = self.slides
+        else:
+            keys = [cache.key(slide) for slide in self.slides]
+            cached = [cache.contains(key) for key in keys]
+            missing = [slide for (slide, hit) in zip(self.slides, cached) if not hit]
+
+        pool = None
+        if jobs > 1 and len(missing) > 1:
+            pool = multiprocessing.Pool(jobs)
+            chunksize = len(missing) // (jobs * 4) + 1
+            rendered = pool.imap(render_fragment, missing, chunksize)
+        else:
+            rendered = itertools.imap(self.render_fragment, missing)
+
+        try:
+            for (i, key) in enumerate(keys):
+                if cache is not None and cached[i]:
+                    yield cache.get(key)
+                else:
+                    fragment = next(rendered)
+                    if cache is not None:
+                        cache.put(key, fragment)
+                    yield fragment
+        finally:
+            if pool:
+                pool.terminate()
+
+    # Write the complete deck to output. See fragments for the meaning of
+    # cache and jobs.
+    def render(self, output, cache=None, jobs=1):
+        writer = Writer(output)
+        writer.doctype('HTML')
+        writer.start('html', { 'lang': 'en' })
 
         elt = self.elt
-        head = elt('head', {},
-                   elt('title', {}, self.title),
-                   elt('meta', { 'charset': 'utf-8' }),
-                   elt('meta', { 'name': 'viewport', 'content': 'width=792, user-scalable=no' }),
-                   elt('meta', { 'http-equiv': 'x-ua-compatible', 'content': 'ie=edge' }),
-                   elt('link', { 'rel': 'stylesheet', 'href': 'shower/themes/ribbon/styles/screen.css' }),
-                   elt('link', { 'rel': 'stylesheet', 'href': 'custom.css' }))
-        self.root.appendChild(head)
-
-        self.body = elt('body', { 'class': 'list' },
-                        elt('header', { 'class': 'caption' },
-                            elt('h1', {}, self.title),
-                            elt('p', {}, self.author)))
-        self.root.appendChild(self.body)
-
-        for slide in self.slides:
-            render = slide.render(self)
-            if isinstance(render, list):
-                for subslide in render:
-                    self.body.appendChild(subslide)
-            else:
-                self.body.appendChild(slide.render(self))
-
-        self.body.appendChild(elt('div', { 'class': 'progress' },
-                                  elt('div', {})))
-        self.body.appendChild(elt('script', { 'src': 'shower/shower.min.js' }))
-
-        self.doc.writexml(output)
+        writer.write(elt('head', {},
+                         elt('title', {}, self.title),
+                         elt('meta', { 'charset': 'utf-8' }),
+                         elt('meta', { 'name': 'viewport', 'content': 'width=792, user-scalable=no' }),
+                         elt('meta', { 'http-equiv': 'x-ua-compatible', 'content': 'ie=edge' }),
+                         elt('link', { 'rel': 'stylesheet', 'href': 'shower/themes/ribbon/styles/screen.css' }),
+                         elt('link', { 'rel': 'stylesheet', 'href': 'custom.css' })))
+
+        writer.start('body', { 'class': 'list' })
+        writer.write(elt('header', { 'class': 'caption' },
+                         elt('h1', {}, self.title),
+                         elt('p', {}, self.author)))
+
+        # Write each slide out as soon as it's rendered, so that only one
+        # slide's elements are ever alive at a time.
+        if cache is None and jobs == 1:
+            for slide in self.slides:
+                self.render_slide(slide, writer)
+        else:
+            for fragment in self.fragments(cache, jobs):
+                writer.raw(fragment)
+
+        writer.write(elt('div', { 'class': 'progress' },
+                         elt('div', {})))
+        writer.write(elt('script', { 'src': 'shower/shower.min.js' }))
+        writer.end()
+        writer.end()
         output.write('\n')
 
+# Render a single slide in a worker process. Slides only use their
+# Presentation as an element factory, so a blank one will do.
+def render_fragment(slide):
+    return Presentation(None, None).render_fragment(slide)
+
 class Slide(object):
     def __init__(self, title, *children):
         self.title = title
@@ -263,54 +356,118 @@ class Code(Content):
 #                               1         2    3          4          5  6         7
 callout_pattern = re.compile(r"`([^`\$]*)`(.)|`([^`\$]*)\$([^`\$]+)\$(.)([^`\$]*)`(.)")
 
+# Parse callout markup into a list of tokens, each of which is one of:
+#
+#   ('text', text)
+#       Plain text, never highlighted.
+#   ('span', label, text)
+#       Text highlighted in the frame for label.
+#   ('nested', label, before, inner_label, inner, after)
+#       The text before + inner + after, highlighted as a whole in the frame
+#       for label; inner alone is highlighted in the frame for inner_label.
+def callout_tokens(code):
+    tokens = []
+    last_end = 0
+    for match in callout_pattern.finditer(code):
+        if last_end < match.start():
+            tokens.append(('text', code[last_end : match.start()]))
+        if match.group(2):
+            tokens.append(('span', match.group(2), match.group(1)))
+        elif match.group(7):
+            tokens.append(('nested', match.group(7), match.group(3),
+                           match.group(5), match.group(4), match.group(6)))
+        last_end = match.end()
+
+    if last_end < len(code):
+        tokens.append(('text', code[last_end :]))
+
+    return tokens
+
+def callout_labels(tokens):
+    labels = set()
+    for token in tokens:
+        if token[0] == 'span':
+            labels.add(token[1])
+        elif token[0] == 'nested':
+            labels.add(token[1])
+            labels.add(token[3])
+    return labels
+
+# Return the frame of tokens for the label selected, as a list of (text,
+# highlighted) pairs.
+def callout_frame(tokens, selected):
+    frame = []
+    for token in tokens:
+        if token[0] == 'text':
+            frame.append((token[1], False))
+        elif token[0] == 'span':
+            frame.append((token[2], token[1] == selected))
+        else:
+            (_, label, before, inner_label, inner, after) = token
+            if inner_label == selected:
+                frame.append((before, False))
+                frame.append((inner, True))
+                frame.append((after, False))
+            else:
+                frame.append((before + inner + after, label == selected))
+    return frame
+
+# Return a list of (text, steps) pairs covering the code in tokens, where
+# steps is a tuple of the step numbers in which text is highlighted. The
+# dictionary step_of maps each label to its step number.
+def callout_steps(tokens, step_of):
+    segments = []
+    for token in tokens:
+        if token[0] == 'text':
+            segments.append((token[1], ()))
+        elif token[0] == 'span':
+            segments.append((token[2], (step_of[token[1]],)))
+        else:
+            (_, label, before, inner_label, inner, after) = token
+            outer = () if label == inner_label else (step_of[label],)
+            segments.append((before, outer))
+            segments.append((inner, outer + (step_of[inner_label],)))
+            segments.append((after, outer))
+    return segments
+
+# Stepped callouts can only use as many steps as custom.css has rules for.
+callout_step_limit = 16
+
 class CodeCallout(Slide):
     def __init__(self, title, code):
         super(CodeCallout, self).__init__(title)
         self.title = title
         self.code = clean_text(code)
+        self.stepped_flag = False
+
+    # Render as a single slide whose highlights advance with shower's 'next'
+    # stepping, instead of a separate slide for every label.
+    def stepped(self):
+        self.stepped_flag = True
+        return self
 
-    def highlight(self, pres, selected):
+    # Return the contents of the <code> element for frame, joining runs of
+    # plain text into single strings.
+    def highlight(self, pres, frame):
         elt = pres.elt
         spans = []
-        last_end = 0
-        for match in callout_pattern.finditer(self.code):
-            if last_end < match.start():
-                spans.append(pres.doc.createTextNode(self.code[last_end : match.start()]))
-
-            if match.group(2):
-                if match.group(2) == selected:
-                    spans.append(elt('span', { 'class': 'highlighted' }, match.group(1)))
-                else:
-                    spans.append(pres.doc.createTextNode(match.group(1)))
-
-            elif match.group(7):
-                if match.group(5) == selected:
-                    spans.append(pres.doc.createTextNode(match.group(3)))
-                    spans.append(elt('span', { 'class': 'highlighted' }, match.group(4)))
-                    spans.append(pres.doc.createTextNode(match.group(6)))
-                elif match.group(7) == selected:
-                    spans.append(elt('span', { 'class': 'highlighted' },
-                                     match.group(3) + match.group(4) + match.group(6)))
-                else:
-                    spans.append(match.group(3) + match.group(4) + match.group(6))
-
-            last_end = match.end()
-
-        if last_end < len(self.code):
-            spans.append(pres.doc.createTextNode(self.code[last_end :]))
-
+        plain = []
+        for (text, highlighted) in frame:
+            if highlighted:
+                if plain:
+                    spans.append(''.join(plain))
+                    plain = []
+                spans.append(elt('span', { 'class': 'highlighted' }, text))
+            elif text:
+                plain.append(text)
+        if plain:
+            spans.append(''.join(plain))
         return spans
 
-    def render(self, pres):
-        elt = pres.elt
-
-        labels = set()
-        for match in callout_pattern.finditer(self.code):
-            if match.group(2):
-                labels.add(match.group(2))
-            elif match.group(7):
-                labels.add(match.group(5))
-                labels.add(match.group(7))
+    # Return a list of (labels, frame) pairs, one for each distinct frame
+    # of the callout, where labels is the list of labels that produce it.
+    def frames(self, tokens):
+        labels = callout_labels(tokens)
         has_zero = '0' in labels
         labels = list(labels)
         labels.sort()
@@ -319,17 +476,119 @@ class CodeCallout(Slide):
         if not has_zero:
             labels = [False] + labels
 
-        slides = []
+        frames = []
         for label in labels:
-            code = elt('code', {}, *self.highlight(pres, label))
-            code.normalize()
+            frame = callout_frame(tokens, label)
+            # Frames that look just like the one before are merged with it.
+            if frames and frame == frames[-1][1]:
+                frames[-1][0].append(label)
+            else:
+                frames.append(([label], frame))
+        return frames
+
+    def render(self, pres):
+        elt = pres.elt
+
+        # Parse the markup once; every frame is generated from the tokens.
+        tokens = callout_tokens(self.code)
+        frames = self.frames(tokens)
+        title = dumb_markdown(pres, self.title)
+
+        if self.stepped_flag and len(frames) <= callout_step_limit:
+            return self.render_stepped(pres, title, tokens, frames)
+
+        slides = []
+        for (labels, frame) in frames:
             div = elt('div', {},
-                      elt('h2', {}, *dumb_markdown(pres, self.title)),
-                      elt('pre', {}, code))
+                      elt('h2', {}, *title),
+                      elt('pre', {}, elt('code', {}, *self.highlight(pres, frame))))
             slides.append(elt('section', { 'class': 'slide' }, div))
 
         return slides
 
+    # Render the callout as one slide. Each highlighted span is tagged with
+    # the classes 'step-N' for the steps in which it should be highlighted,
+    # and the <pre> is preceded by a hidden marker for each step: 'step-0'
+    # is always active, the rest are marked 'next', so shower activates them
+    # one by one. The current step is the last active marker, and custom.css
+    # highlights the spans tagged with it.
+    def render_stepped(self, pres, title, tokens, frames):
+        elt = pres.elt
+
+        step_of = {}
+        for (step, (labels, frame)) in enumerate(frames):
+            for label in labels:
+                step_of[label] = step
+
+        spans = []
+        for (text, steps) in callout_steps(tokens, step_of):
+            if not text:
+                continue
+            if spans and spans[-1][1] == steps:
+                spans[-1] = (spans[-1][0] + text, steps)
+            else:
+                spans.append((text, steps))
+
+        code = elt('code', {})
+        for (text, steps) in spans:
+            if steps:
+                classes = ' '.join('step-{}'.format(step) for step in sorted(set(steps)))
+                code.appendChild(elt('span', { 'class': classes }, text))
+            else:
+                code.appendChild(text)
+
+        div = elt('div', {}, elt('h2', {}, *title))
+        for marker in step_markers(elt, len(frames)):
+            div.appendChild(marker)
+        div.appendChild(elt('pre', {}, code))
+        return elt('section', { 'class': 'slide' }, div)
+
+# Return the hidden markers that step a slide through count steps: the
+# current step is the last active one. See CodeCallout.render_stepped.
+def step_markers(elt, count):
+    markers = [elt('b', { 'class': 'step step-0 active' }, '')]
+    for step in range(1, count):
+        markers.append(elt('b', { 'class': 'step step-{} next'.format(step) }, ''))
+    markers.append(elt('b', { 'class': 'step' }, ''))
+    return markers
+
+frame_pattern = re.compile(r'<g class="frame step-\d+"')
+
+# A figure written by svgframes.py's FrameSeries.save_stepped, inline, with
+# a step for each of its frames, in place of a series of Picture or
+# BigPicture slides. With no title, it fills the slide, like BigPicture.
+class SteppedPicture(Slide):
+    def __init__(self, title, image):
+        super(SteppedPicture, self).__init__(title)
+        with open(image) as f:
+            markup = f.read().decode('utf-8')
+        self.markup = markup[markup.index('<svg'):]
+
+    def render(self, pres):
+        elt = pres.elt
+        div = elt('div', {})
+        if self.title:
+            div.appendChild(elt('h2', {}, *dumb_markdown(pres, self.title)))
+        for marker in step_markers(elt, len(frame_pattern.findall(self.markup))):
+            div.appendChild(marker)
+        div.appendChild(Raw(self.markup))
+        classes = 'slide' if self.title else 'slide cover bigpicture'
+        return elt('section', { 'class': classes }, div)
+
+# A slide embedding a live page, like the Mandelbrot explorer that
+# python/tileserver.py serves at url.
+class Explorer(Slide):
+    def __init__(self, title, url):
+        super(Explorer, self).__init__(title)
+        self.url = url
+
+    def render(self, pres):
+        elt = pres.elt
+        return elt('section', { 'class': 'slide' },
+                   elt('div', {},
+                       elt('h2', {}, *dumb_markdown(pres, self.title)),
+                       elt('iframe', { 'class': 'explorer', 'src': self.url })))
+
 class GnuPlot(Slide):
     def __init__(self, title, slide):
         self.title = title
@@ -343,3 +602,18 @@ class GnuPlot(Slide):
                        elt('h2', {}, *dumb_markdown(pres, self.title)),
                        elt('img', { 'class': 'gnuplot', 'src': self.slide })))
 
+# A chart drawn as inline SVG by python/charts.py, in place of a GnuPlot
+# slide's PNG. The chart's markup is part of the slide, so that the slide is
+# rendered again when the chart changes.
+class Chart(Slide):
+    def __init__(self, title, markup):
+        super(Chart, self).__init__(title)
+        self.markup = markup
+
+    def render(self, pres):
+        elt = pres.elt
+        return elt('section', { 'class': 'slide' },
+                   elt('div', {},
+                       elt('h2', {}, *dumb_markdown(pres, self.title)),
+                       Raw(self.markup)))
+
@@ -0,0 +1,318 @@
+from __future__ import division, print_function
+import argparse
+import hashlib
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+import mandelbrot
+
+# Render Mandelbrot images from square tiles, keeping each tile in an
+# on-disk cache, so that images that share tiles only compute them once:
+# re-rendering the same image, cropping different views from it, or the
+# frames of a zoom animation at the same zoom level.
+#
+# Tiles belong to a pyramid: level 0 is an image with some bounds and
+# corners, and level z is the same region of the plane at 2^z times the
+# resolution. Each level is cut into tile_size by tile_size tiles, counting
+# from its upper left corner; tiles on the right and bottom edges may be
+# smaller. A tile is rendered with mandelbrot.render as a rectangle of its
+# level's full image, so an image assembled from tiles is pixel for pixel
+# the image mandelbrot.render would produce for the whole level.
+
+default_tile_size = 256
+
+# The default limit on the size of the tile cache, in bytes.
+default_cache_bytes = 256 * 1024 * 1024
+
+class Pyramid(object):
+    def __init__(self, bounds, ul, lr, tile_size=default_tile_size):
+        self.bounds = tuple(bounds)
+        self.ul = tuple(ul)
+        self.lr = tuple(lr)
+        self.tile_size = tile_size
+
+    # The bounds of the full image at the given zoom level.
+    def level_bounds(self, zoom):
+        return (self.bounds[0] << zoom, self.bounds[1] << zoom)
+
+    # The number of columns and rows of tiles at the given zoom level.
+    def grid(self, zoom):
+        (width, height) = self.level_bounds(zoom)
+        return (-(-width // self.tile_size), -(-height // self.tile_size))
+
+    # Return (left, top, width, height), the rectangle of its level's image
+    # that the given tile covers.
+    def tile_rect(self, zoom, tx, ty):
+        (width, height) = self.level_bounds(zoom)
+        (left, top) = (tx * self.tile_size, ty * self.tile_size)
+        return (left, top,
+                min(self.tile_size, width - left),
+                min(self.tile_size, height - top))
+
+    # The inverse of mandelbrot.pixel_to_point at the given zoom level:
+    # return the (column, row) of point, as floats.
+    def point_to_pixel(self, zoom, point):
+        bounds = self.level_bounds(zoom)
+        return ((point[0] - self.ul[0]) * bounds[0] / (self.lr[0] - self.ul[0]),
+                (self.ul[1] - point[1]) * bounds[1] / (self.ul[1] - self.lr[1]))
+
+    # Return a list of the (tx, ty) coordinates of the tiles that the width
+    # by height rectangle with upper left pixel (left, top) overlaps.
+    def covering(self, left, top, width, height):
+        size = self.tile_size
+        return [(tx, ty)
+                for ty in range(top // size, (top + height - 1) // size + 1)
+                for tx in range(left // size, (left + width - 1) // size + 1)]
+
+    # Return (left, top), the upper left pixel of the width by height
+    # rectangle at the given zoom level whose center is nearest point, moved
+    # as little as necessary to lie within the level's image.
+    def centered(self, zoom, point, width, height):
+        (level_width, level_height) = self.level_bounds(zoom)
+        (column, row) = self.point_to_pixel(zoom, point)
+        return (min(max(int(round(column - width / 2)), 0), level_width - width),
+                min(max(int(round(row - height / 2)), 0), level_height - height))
+
+    # Render the given tile, and return it as a 2-D uint8 array.
+    def render_tile(self, zoom, tx, ty, limit=255, shortcuts=()):
+        (left, top, width, height) = self.tile_rect(zoom, tx, ty)
+        pixels = np.empty((height, width), dtype=np.uint8)
+        mandelbrot.render(pixels, self.level_bounds(zoom), self.ul, self.lr, top, limit,
+                          shortcuts, left)
+        return pixels
+
+# An on-disk cache of rendered tiles, evicting the least recently used
+# tiles once the files in it add up to more than max_bytes.
+#
+# Each tile is stored as a .npy file named by a hash of its pyramid, zoom
+# level, tile coordinates and iteration limit. Shortcuts don't change the
+# pixels, so they aren't part of the key. Reading a tile touches its file,
+# so file modification times give the order of use.
+class TileCache(object):
+    def __init__(self, directory, max_bytes=default_cache_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.total = sum(size for (_, _, size) in self.entries())
+
+    def key(self, pyramid, zoom, tx, ty, limit):
+        description = repr((pyramid.bounds, pyramid.ul, pyramid.lr, pyramid.tile_size,
+                            zoom, tx, ty, limit))
+        return hashlib.sha1(description.encode('ascii')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    # Return a list of (mtime, path, size) triples for the tiles in the
+    # cache.
+    def entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npy'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    # Another process evicted it.
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    # Return the tile cached under key, or None if there isn't one, and
+    # count the lookup as a hit or a miss.
+    def get(self, key):
+        path = self.path(key)
+        try:
+            tile = np.load(path)
+            os.utime(path, None)
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return tile
+
+    def put(self, key, tile):
+        path = self.path(key)
+        # Write to a temporary name and rename, so that an interrupted
+        # render never leaves a truncated tile behind.
+        temp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp, 'wb') as f:
+            np.save(f, tile)
+        self.total += os.path.getsize(temp)
+        os.replace(temp, path)
+        if self.total > self.max_bytes:
+            self.evict()
+
+    # Delete the least recently used tiles until the cache fits in
+    # max_bytes again.
+    def evict(self):
+        entries = sorted(self.entries())
+        self.total = sum(size for (_, _, size) in entries)
+        for (_, path, size) in entries:
+            if self.total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.total -= size
+            self.evicted += 1
+
+    def report(self, file):
+        print('tiles: {} rendered, {} from cache, {} evicted'.format(
+            self.misses, self.hits, self.evicted), file=file)
+
+# The body of each worker process: render one tile.
+def render_tile(job):
+    (pyramid, zoom, tx, ty, limit, shortcuts) = job
+    return ((tx, ty), pyramid.render_tile(zoom, tx, ty, limit, shortcuts))
+
+# Assemble images from the tiles of pyramid, taking tiles from cache where
+# it has them, and rendering the rest with workers processes.
+class TileRenderer(object):
+    def __init__(self, pyramid, cache, limit=255, shortcuts=(), workers=1):
+        self.pyramid = pyramid
+        self.cache = cache
+        self.limit = limit
+        self.shortcuts = shortcuts
+        self.workers = workers
+
+    # Return a dictionary mapping each (tx, ty) pair in coordinates to its
+    # tile at the given zoom level.
+    def tiles(self, zoom, coordinates):
+        tiles = {}
+        missing = []
+        for (tx, ty) in coordinates:
+            tile = self.cache.get(self.cache.key(self.pyramid, zoom, tx, ty, self.limit))
+            if tile is None:
+                missing.append((self.pyramid, zoom, tx, ty, self.limit, self.shortcuts))
+            else:
+                tiles[(tx, ty)] = tile
+
+        if self.workers > 1 and len(missing) > 1:
+            pool = multiprocessing.Pool(min(self.workers, len(missing)))
+            try:
+                rendered = list(pool.imap_unordered(render_tile, missing))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            rendered = [render_tile(job) for job in missing]
+
+        for ((tx, ty), tile) in rendered:
+            self.cache.put(self.cache.key(self.pyramid, zoom, tx, ty, self.limit), tile)
+            tiles[(tx, ty)] = tile
+        return tiles
+
+    # Return the width by height rectangle of the given zoom level's image
+    # whose upper left pixel is (left, top), as a 2-D uint8 array. The
+    # rectangle must lie within the level's image.
+    def view(self, zoom, left, top, width, height):
+        tiles = self.tiles(zoom, self.pyramid.covering(left, top, width, height))
+        return self.assemble(tiles, left, top, width, height)
+
+    # Copy the rectangle described as for view out of tiles, a dictionary
+    # like the one the tiles method returns, which must include every tile
+    # the rectangle overlaps.
+    def assemble(self, tiles, left, top, width, height):
+        size = self.pyramid.tile_size
+        pixels = np.empty((height, width), dtype=np.uint8)
+        for ((tx, ty), tile) in tiles.items():
+            (tile_left, tile_top) = (tx * size, ty * size)
+            # The overlap of this tile and the view, in level coordinates.
+            (x0, y0) = (max(left, tile_left), max(top, tile_top))
+            x1 = min(left + width, tile_left + tile.shape[1])
+            y1 = min(top + height, tile_top + tile.shape[0])
+            pixels[y0 - top : y1 - top, x0 - left : x1 - left] = \
+                tile[y0 - tile_top : y1 - tile_top, x0 - tile_left : x1 - tile_left]
+        return pixels
+
+    # Return the whole image at the given zoom level.
+    def image(self, zoom=0):
+        (width, height) = self.pyramid.level_bounds(zoom)
+        return self.view(zoom, 0, 0, width, height)
+
+# Parse a range of zoom levels like '0-5', or a single level.
+def parse_levels(s):
+    (first, _, last) = s.partition('-')
+    return range(int(first), int(last or first) + 1)
+
+def add_cache_arguments(parser):
+    parser.add_argument('--tile-size', type=int, default=default_tile_size, metavar='N',
+                        help='width and height of tiles, in pixels (default: %(default)s)')
+    parser.add_argument('--cache-dir', default='.tile-cache', metavar='DIR',
+                        help='directory to cache tiles in (default: %(default)s)')
+    parser.add_argument('--cache-size', type=int,
+                        default=default_cache_bytes // (1024 * 1024), metavar='MB',
+                        help='evict tiles when the cache exceeds MB megabytes '
+                        '(default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes (default: %(default)s)')
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Render Mandelbrot images from cached tiles.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    image = commands.add_parser('image', help='render a whole zoom level to a PNG file')
+    mandelbrot.add_region_arguments(image)
+    add_cache_arguments(image)
+    image.add_argument('--zoom', type=int, default=0,
+                       help='render at 2^ZOOM times the size (default: %(default)s)')
+    image.add_argument('output', metavar='FILE', help='the PNG file to write')
+
+    pyramid = commands.add_parser(
+        'pyramid', help='precompute the tiles and frames for a zoom animation')
+    mandelbrot.add_region_arguments(pyramid)
+    add_cache_arguments(pyramid)
+    pyramid.add_argument('--center', required=True, metavar='RE,IM',
+                         help='the point to zoom in on; write negative values as '
+                         '--center=-0.75,0.1')
+    pyramid.add_argument('--levels', type=parse_levels, default=parse_levels('0-4'),
+                         metavar='FIRST-LAST',
+                         help='zoom levels to render (default: 0-4)')
+    pyramid.add_argument('--viewport', default='480x270', metavar='WxH',
+                         help='size of each frame, in pixels (default: %(default)s)')
+    pyramid.add_argument('--output-dir', required=True, metavar='DIR',
+                         help='write frames to DIR/frame-LEVEL.png, and the tiles they '
+                         'use to DIR/LEVEL/X/Y.png')
+
+    args = parser.parse_args(argv[1:])
+    (bounds, ul, lr) = mandelbrot.region_from_args(args)
+    tiles = Pyramid(bounds, ul, lr, args.tile_size)
+    cache = TileCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    renderer = TileRenderer(tiles, cache, args.limit, args.shortcuts, args.workers)
+
+    if args.command == 'image':
+        mandelbrot.write_image(args.output, renderer.image(args.zoom))
+    else:
+        center = mandelbrot.parse_pair(args.center, ',', float)
+        (width, height) = mandelbrot.parse_pair(args.viewport, 'x', int)
+        if width > bounds[0] or height > bounds[1]:
+            sys.exit('viewport {} is larger than the image'.format(args.viewport))
+        if not os.path.isdir(args.output_dir):
+            os.makedirs(args.output_dir)
+        for zoom in args.levels:
+            (left, top) = tiles.centered(zoom, center, width, height)
+            used = renderer.tiles(zoom, tiles.covering(left, top, width, height))
+            frame = renderer.assemble(used, left, top, width, height)
+            mandelbrot.write_image(os.path.join(args.output_dir,
+                                                'frame-{}.png'.format(zoom)), frame)
+            for ((tx, ty), tile) in sorted(used.items()):
+                directory = os.path.join(args.output_dir, str(zoom), str(tx))
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+                mandelbrot.write_image(os.path.join(directory, '{}.png'.format(ty)), tile)
+
+    cache.report(sys.stderr)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,420 @@
+from __future__ import division, print_function
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import re
+import signal
+import sys
+
+import mandelbrot
+import tiles
+
+# A small HTTP server for exploring the Mandelbrot set live during the talk:
+# it serves a page that pans and zooms around the set (see the Explorer
+# slide in slides.py, which embeds it), and renders the page's tiles on
+# demand in a pool of worker processes.
+#
+# Each tile is served in two versions: a coarse one, rendered with a low
+# iteration limit, which is quick to compute, and a fine one, with the full
+# limit. The page asks for the coarse version first and the fine one once
+# that arrives, so something appears as soon as possible. Coarse tiles are
+# always rendered ahead of fine ones.
+#
+# Tiles come from a tiles.Pyramid covering the whole set, and go into a
+# tiles.TileCache. When the page scrolls a tile out of view, it abandons
+# the request, and the server drops the tile from its queue if no worker
+# has started on it yet. (A tile a worker has already started is finished
+# and cached, but not sent.) The queue holds at most queue_depth tiles; when
+# it overflows, the oldest request is refused with '503 Service
+# Unavailable', and the page asks again if the tile is still in view. That
+# keeps a burst of panning and zooming from backing up work that nobody is
+# going to look at, and keeps the presenter's laptop responsive.
+#
+# Reading, writing and encoding tiles happens off the event loop too, so
+# that a burst of cache hits doesn't hold up other requests. The cache is
+# only touched from a single thread, which keeps its bookkeeping simple.
+#
+# URLs:
+#
+#   /                     the explorer page
+#   /coarse/Z/X/Y.png     the coarse version of tile (X, Y) at zoom level Z
+#   /fine/Z/X/Y.png       the fine version of the same tile
+
+coarse_limit = 32
+fine_limit = 255
+
+# The deepest zoom level the page allows. Past this, float64 runs out of
+# precision to tell neighboring pixels apart.
+max_zoom = 40
+
+default_queue_depth = 32
+
+# Level 0 is a single tile covering the whole set.
+def world(tile_size):
+    return tiles.Pyramid((tile_size, tile_size), (-2.5, 2.0), (1.5, -2.0), tile_size)
+
+# Raised in a request that was pushed out of a full queue.
+class Overloaded(Exception):
+    pass
+
+# A queue of tiles waiting for a worker, with coarse tiles ahead of fine
+# ones. Each entry is a pair (job, future), where job is an argument for
+# tiles.render_tile, and future is the asyncio future to resolve with the
+# tile.
+#
+# Call open from the event loop before using the queue: before Python 3.10,
+# an asyncio.Condition belongs to the loop that was current when it was
+# made, so it can't be made before asyncio.run starts the loop.
+class TileQueue(object):
+    def __init__(self, depth):
+        self.depth = depth
+        self.pending = { 'coarse': collections.deque(), 'fine': collections.deque() }
+        self.condition = None
+        self.dropped = 0
+
+    def open(self):
+        self.condition = asyncio.Condition()
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.pending.values())
+
+    # Add job to the queue, and return a future for its tile.
+    async def put(self, quality, job):
+        future = asyncio.get_running_loop().create_future()
+        async with self.condition:
+            # Forget requests that have been abandoned since they were queued.
+            for queue in self.pending.values():
+                live = [entry for entry in queue if not entry[1].done()]
+                queue.clear()
+                queue.extend(live)
+
+            self.pending[quality].append((job, future))
+            while len(self) > self.depth:
+                # Refuse the oldest request: if it's still wanted, it's more
+                # likely than the newer ones to have scrolled out of view.
+                queue = self.pending['fine'] or self.pending['coarse']
+                (_, oldest) = queue.popleft()
+                oldest.set_exception(Overloaded())
+                self.dropped += 1
+            self.condition.notify()
+        return future
+
+    # Wait for a request that is still wanted, remove it from the queue,
+    # and return its (job, future) pair.
+    async def get(self):
+        async with self.condition:
+            while True:
+                for quality in ('coarse', 'fine'):
+                    queue = self.pending[quality]
+                    while queue:
+                        entry = queue.popleft()
+                        if not entry[1].done():
+                            return entry
+                await self.condition.wait()
+
+# Leave interrupts to the server process, which shuts the pool down.
+def ignore_interrupts():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+class TileServer(object):
+    def __init__(self, cache, workers, queue_depth=default_queue_depth,
+                 tile_size=tiles.default_tile_size):
+        self.pyramid = world(tile_size)
+        self.cache = cache
+        self.workers = workers
+        self.queue = TileQueue(queue_depth)
+        self.pool = concurrent.futures.ProcessPoolExecutor(workers,
+                                                          initializer=ignore_interrupts)
+        self.disk = concurrent.futures.ThreadPoolExecutor(1)
+        self.cancelled = 0
+
+    # Run forever as one of the workers' dispatchers: take requests from the
+    # queue and render them in the pool.
+    async def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            (job, future) = await self.queue.get()
+            try:
+                (_, tile) = await loop.run_in_executor(self.pool, tiles.render_tile, job)
+            except Exception as error:
+                if not future.done():
+                    future.set_exception(error)
+                continue
+            (pyramid, zoom, tx, ty, limit, _) = job
+            await loop.run_in_executor(self.disk, self.cache.put,
+                                       self.cache.key(pyramid, zoom, tx, ty, limit), tile)
+            if not future.done():
+                future.set_result(tile)
+
+    # Return the given tile, from the cache if possible, and otherwise by
+    # queuing it for a worker. If reader reaches end of file before the
+    # tile is ready, meaning the client has abandoned the request, return
+    # None.
+    async def tile(self, quality, zoom, tx, ty, reader):
+        limit = coarse_limit if quality == 'coarse' else fine_limit
+        tile = await asyncio.get_running_loop().run_in_executor(
+            self.disk, self.cache.get, self.cache.key(self.pyramid, zoom, tx, ty, limit))
+        if tile is not None:
+            return tile
+
+        future = await self.queue.put(quality, (self.pyramid, zoom, tx, ty, limit, ()))
+        closed = asyncio.ensure_future(reader.read(1))
+        try:
+            await asyncio.wait([future, closed], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closed.cancel()
+        if not future.done():
+            future.cancel()
+            self.cancelled += 1
+            return None
+        return future.result()
+
+    async def respond(self, writer, status, content_type, body):
+        writer.write('HTTP/1.1 {}\r\n'
+                     'Content-Type: {}\r\n'
+                     'Content-Length: {}\r\n'
+                     'Cache-Control: no-cache\r\n'
+                     'Connection: close\r\n'
+                     '\r\n'.format(status, content_type, len(body)).encode('ascii'))
+        writer.write(body)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        try:
+            request = (await reader.readline()).decode('latin-1').split()
+            # Skip the headers; nothing in them matters here.
+            while (await reader.readline()).strip():
+                pass
+            if len(request) != 3 or request[0] != 'GET':
+                await self.respond(writer, '400 Bad Request', 'text/plain', b'bad request\n')
+                return
+            path = request[1]
+
+            if path == '/':
+                page = explorer_page % { 'tile_size': self.pyramid.tile_size,
+                                         'max_zoom': max_zoom,
+                                         'ul': list(self.pyramid.ul),
+                                         'lr': list(self.pyramid.lr) }
+                await self.respond(writer, '200 OK', 'text/html; charset=utf-8',
+                                   page.encode('utf-8'))
+                return
+
+            match = re.match(r'/(coarse|fine)/(\d+)/(\d+)/(\d+)\.png$', path)
+            if match:
+                (zoom, tx, ty) = (int(n) for n in match.group(2, 3, 4))
+                (columns, rows) = self.pyramid.grid(zoom)
+                match = zoom <= max_zoom and tx < columns and ty < rows and match
+            if not match:
+                await self.respond(writer, '404 Not Found', 'text/plain', b'not found\n')
+                return
+
+            try:
+                tile = await self.tile(match.group(1), zoom, tx, ty, reader)
+            except Overloaded:
+                await self.respond(writer, '503 Service Unavailable', 'text/plain',
+                                   b'too many tiles queued\n')
+                return
+            if tile is not None:
+                image = await asyncio.get_running_loop().run_in_executor(
+                    None, mandelbrot.encode_image, tile)
+                await self.respond(writer, '200 OK', 'image/png', image)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def report(self, file):
+        self.cache.report(file)
+        print('requests: {} abandoned, {} refused'.format(self.cancelled, self.queue.dropped),
+              file=file)
+
+    async def serve(self, port):
+        self.queue.open()
+        server = await asyncio.start_server(self.handle, 'localhost', port)
+        dispatchers = [asyncio.ensure_future(self.dispatch()) for _ in range(self.workers)]
+        print('serving http://localhost:{}/'.format(port))
+        try:
+            await server.serve_forever()
+        finally:
+            for dispatcher in dispatchers:
+                dispatcher.cancel()
+            server.close()
+
+# The explorer page. Drag to pan; scroll or double-click to zoom.
+explorer_page = """\
+<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Mandelbrot explorer</title>
+<style>
+html, body { margin: 0; height: 100%%; overflow: hidden; background: #000; }
+#view { position: absolute; left: 0; top: 0; right: 0; bottom: 0; cursor: move; }
+#view img { position: absolute; }
+#status { position: absolute; left: 6px; bottom: 4px; color: #888; font: 12px sans-serif; }
+</style>
+</head>
+<body>
+<div id="view"></div>
+<div id="status"></div>
+<script>
+(function (tileSize, maxZoom, ul, lr) {
+    var view = document.getElementById('view');
+    var status = document.getElementById('status');
+
+    // The center of the view, in level 0 pixels, and the zoom level.
+    var center = { x: tileSize / 2, y: tileSize / 2 };
+    var zoom = 0;
+
+    // The tiles requested for the current view, by 'Z/X/Y'. Each has an
+    // AbortController for its requests, and the images loaded so far.
+    var shown = {};
+
+    function load(key, tile, quality) {
+        return fetch('/' + quality + '/' + key + '.png', { signal: tile.controller.signal })
+            .then(function (response) {
+                if (!response.ok)
+                    throw response.status;
+                return response.blob();
+            })
+            .then(function (blob) {
+                var image = new Image();
+                image.onload = function () { URL.revokeObjectURL(image.src); };
+                image.src = URL.createObjectURL(blob);
+                view.appendChild(image);
+                tile.images.push(image);
+                place(tile);
+            });
+    }
+
+    function show(key, x, y) {
+        var tile = { x: x, y: y, controller: new AbortController(), images: [] };
+        shown[key] = tile;
+        load(key, tile, 'coarse')
+            .then(function () { return load(key, tile, 'fine'); })
+            .catch(function (error) {
+                // The server was too busy; try again if it's still in view.
+                if (error === 503 && shown[key] === tile) {
+                    hide(key);
+                    setTimeout(layout, 250);
+                }
+            });
+    }
+
+    function hide(key) {
+        var tile = shown[key];
+        tile.controller.abort();
+        tile.images.forEach(function (image) { view.removeChild(image); });
+        delete shown[key];
+    }
+
+    function origin() {
+        var scale = Math.pow(2, zoom);
+        return { x: Math.round(center.x * scale - view.clientWidth / 2),
+                 y: Math.round(center.y * scale - view.clientHeight / 2) };
+    }
+
+    function place(tile) {
+        var o = origin();
+        tile.images.forEach(function (image) {
+            image.style.left = (tile.x * tileSize - o.x) + 'px';
+            image.style.top = (tile.y * tileSize - o.y) + 'px';
+        });
+    }
+
+    // Request the tiles in view, abandon those that aren't, and move them
+    // all into place.
+    function layout() {
+        var o = origin();
+        var last = Math.pow(2, zoom) - 1;
+        var wanted = {};
+        var x0 = Math.max(0, Math.floor(o.x / tileSize));
+        var x1 = Math.min(last, Math.floor((o.x + view.clientWidth - 1) / tileSize));
+        var y0 = Math.max(0, Math.floor(o.y / tileSize));
+        var y1 = Math.min(last, Math.floor((o.y + view.clientHeight - 1) / tileSize));
+        for (var y = y0; y <= y1; y++) {
+            for (var x = x0; x <= x1; x++) {
+                var key = zoom + '/' + x + '/' + y;
+                wanted[key] = true;
+                if (!shown[key])
+                    show(key, x, y);
+            }
+        }
+        for (var key in shown) {
+            if (wanted[key])
+                place(shown[key]);
+            else
+                hide(key);
+        }
+
+        var re = ul[0] + center.x * (lr[0] - ul[0]) / tileSize;
+        var im = ul[1] - center.y * (ul[1] - lr[1]) / tileSize;
+        status.textContent = 'zoom ' + zoom + ', center ' + re + ', ' + im;
+    }
+
+    // Zoom by step levels, keeping the point under (clientX, clientY) still.
+    function zoomBy(step, clientX, clientY) {
+        var next = Math.max(0, Math.min(maxZoom, zoom + step));
+        var dx = clientX - view.clientWidth / 2;
+        var dy = clientY - view.clientHeight / 2;
+        center.x += dx / Math.pow(2, zoom) - dx / Math.pow(2, next);
+        center.y += dy / Math.pow(2, zoom) - dy / Math.pow(2, next);
+        zoom = next;
+        layout();
+    }
+
+    var drag = null;
+    view.addEventListener('mousedown', function (event) {
+        drag = { x: event.clientX, y: event.clientY };
+        event.preventDefault();
+    });
+    window.addEventListener('mousemove', function (event) {
+        if (!drag)
+            return;
+        var scale = Math.pow(2, zoom);
+        center.x -= (event.clientX - drag.x) / scale;
+        center.y -= (event.clientY - drag.y) / scale;
+        drag = { x: event.clientX, y: event.clientY };
+        layout();
+    });
+    window.addEventListener('mouseup', function () { drag = null; });
+    view.addEventListener('wheel', function (event) {
+        zoomBy(event.deltaY < 0 ? 1 : -1, event.clientX, event.clientY);
+        event.preventDefault();
+    });
+    view.addEventListener('dblclick', function (event) {
+        zoomBy(event.shiftKey ? -1 : 1, event.clientX, event.clientY);
+    });
+    window.addEventListener('resize', layout);
+    layout();
+})(%(tile_size)d, %(max_zoom)d, %(ul)s, %(lr)s);
+</script>
+</body>
+</html>
+"""
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Serve an interactive Mandelbrot explorer.')
+    parser.add_argument('--port', type=int, default=8001,
+                        help='port to serve on (default: %(default)s)')
+    parser.add_argument('--queue-depth', type=int, default=default_queue_depth, metavar='N',
+                        help='most tiles to queue before refusing requests '
+                        '(default: %(default)s)')
+    tiles.add_cache_arguments(parser)
+    args = parser.parse_args(argv[1:])
+
+    cache = tiles.TileCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    server = TileServer(cache, args.workers, args.queue_depth, args.tile_size)
+    try:
+        asyncio.run(server.serve(args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.pool.shutdown()
+        server.disk.shutdown()
+        server.report(sys.stderr)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,190 @@
+from __future__ import print_function
+import BaseHTTPServer
+import fnmatch
+import glob
+import os
+import SimpleHTTPServer
+import SocketServer
+import subprocess
+import sys
+import threading
+import time
+import urlparse
+
+# Watch mode for gen.py: rebuild slides.html whenever one of its inputs
+# changes, and tell any open copies of the deck to reload themselves.
+#
+# Each build runs gen.py afresh in a subprocess, so edits to gen.py and
+# slides.py take effect, and the render cache means only the slides that
+# actually changed get re-rendered. Builds are numbered. When this server
+# sends slides.html, it adds a script carrying the current build number,
+# which long-polls the /__build URL and reloads the page when a newer build
+# appears; slides.html itself is left just as gen.py wrote it. Shower keeps
+# the current slide in the URL's fragment, so the reloaded deck comes back
+# to the same slide.
+#
+# Only changes to gen.py's inputs need a build. When just the stylesheet or
+# an image the page loads itself changes, the build number is advanced
+# without one, so the deck reloads and picks up the new file.
+
+# The files gen.py reads: its source, the .data files for --svg-charts, and
+# the SVG figures that slides inline.
+input_patterns = ['python/*.py', '*.data', '*/*.data', 'images/*.svg']
+
+watched_patterns = input_patterns + ['custom.css', 'images/*']
+
+poll_interval = 0.1
+
+deck = '/slides.html'
+
+# Reload the deck when the server reports a build newer than the one this
+# page came from.
+live_reload_script = """<script>
+(function poll(build) {
+    var request = new XMLHttpRequest();
+    request.open('GET', '/__build?since=' + build);
+    request.onload = function () {
+        var latest = parseInt(request.responseText, 10);
+        if (latest !== build) {
+            location.reload();
+        } else {
+            poll(build);
+        }
+    };
+    request.onerror = function () {
+        setTimeout(function () { poll(build); }, 1000);
+    };
+    request.send();
+})(%d);
+</script>"""
+
+# Return a dictionary mapping each watched file to its modification time.
+def snapshot():
+    times = {}
+    for pattern in watched_patterns:
+        for path in glob.glob(pattern):
+            try:
+                times[path] = os.stat(path).st_mtime
+            except OSError:
+                # The file was deleted between the glob and the stat.
+                pass
+    return times
+
+def changed_files(old, new):
+    return sorted(path for path in set(old) | set(new)
+                  if old.get(path) != new.get(path))
+
+def is_input(path):
+    return any(fnmatch.fnmatch(path, pattern) for pattern in input_patterns)
+
+# The number of the latest build, which request handler threads wait on.
+class BuildCounter(object):
+    def __init__(self):
+        self.number = 0
+        self.condition = threading.Condition()
+
+    def advance(self, number):
+        with self.condition:
+            self.number = number
+            self.condition.notify_all()
+
+    # Wait until the build number is no longer since, or until timeout
+    # seconds have passed, and return the current build number.
+    def wait(self, since, timeout):
+        deadline = time.time() + timeout
+        with self.condition:
+            while self.number == since and time.time() < deadline:
+                self.condition.wait(deadline - time.time())
+            return self.number
+
+class ReloadHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        if url.path == deck:
+            return self.send_deck()
+        if url.path != '/__build':
+            return SimpleHTTPServer.SimpleHTTPRequestHandler.do_GET(self)
+
+        query = urlparse.parse_qs(url.query)
+        since = int(query.get('since', ['-1'])[0])
+        number = str(self.server.builds.wait(since, 30))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(number)))
+        self.end_headers()
+        self.wfile.write(number)
+
+    # Send slides.html with live_reload_script added at the end of its body.
+    # Take the build number first: if a build finishes in between, the page
+    # just reloads once more.
+    def send_deck(self):
+        number = self.server.builds.number
+        try:
+            with open(self.translate_path(deck), 'rb') as f:
+                page = f.read()
+        except IOError:
+            return self.send_error(404, 'File not found')
+        (body, end, rest) = page.rpartition('</body>')
+        page = body + live_reload_script % number + end + rest
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    # Don't let the browser use stale copies of images or stylesheets.
+    def end_headers(self):
+        self.send_header('Cache-Control', 'no-cache')
+        SimpleHTTPServer.SimpleHTTPRequestHandler.end_headers(self)
+
+    def log_message(self, format, *args):
+        pass
+
+class ReloadServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, builds):
+        BaseHTTPServer.HTTPServer.__init__(self, address, ReloadHandler)
+        self.builds = builds
+
+def build(args, number):
+    start = time.time()
+    status = subprocess.call([sys.executable, os.path.join('python', 'gen.py')] + args)
+    print('build {} {} in {:.0f}ms'.format(number,
+                                           'finished' if status == 0 else 'FAILED',
+                                           (time.time() - start) * 1000))
+    return status == 0
+
+# Serve the deck on port, rebuilding it with gen.py and the arguments in
+# args whenever a watched file changes. Runs until interrupted.
+def watch(args, port):
+    builds = BuildCounter()
+    server = ReloadServer(('localhost', port), builds)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    number = 1
+    build(args, number)
+    builds.advance(number)
+    print('serving http://localhost:{}/slides.html'.format(port))
+
+    times = snapshot()
+    try:
+        while True:
+            time.sleep(poll_interval)
+            new_times = snapshot()
+            changes = changed_files(times, new_times)
+            if not changes:
+                continue
+            times = new_times
+            print('changed: ' + ', '.join(changes))
+            if any(is_input(path) for path in changes) and not build(args, number + 1):
+                continue
+            number += 1
+            builds.advance(number)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
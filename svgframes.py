@@ -0,0 +1,213 @@
+from __future__ import print_function
+import codecs
+import collections
+import re
+import sys
+import xml.dom
+import xml.dom.minidom
+
+from svgpicture import SVGPicture, layout
+
+# A series of SVG frames, like the squaring-N.svg and subsets-N.svg figures
+# in the talk, which build up a picture a step at a time. Rather than
+# repeating everything in every frame, a FrameSeries draws each frame from
+# shared parts: each part is written once, in <defs>, and frames refer to
+# the parts they show with <use>.
+#
+# The background of a series is whatever its picture's root element holds;
+# it's drawn under every frame. Add parts with part, and describe each
+# frame with frame, as a list of the parts it shows, plus perhaps elements
+# drawn only in that frame:
+#
+#   pic = SVGPicture(('1280px', '720px'), (1280, 720))
+#   pic.root.appendChild(pic.rect((0, 0), (1280, 720), fill='white'))
+#   series = FrameSeries(pic, 'orbit-')
+#   axis = series.part(pic.line((0, 360), (1280, 360), stroke='black'))
+#   series.frame(axis)
+#   series.frame(axis, pic.path('M640 360L700 300', stroke='red'))
+#
+# Then either write each frame to a file of its own, or write them all to a
+# single file, with each frame in a <g class="frame step-N">, for the
+# SteppedPicture slide in python/slides.py to step through. Every frame but
+# the first is hidden with display="none", so the file shows the first
+# frame when it's viewed on its own; custom.css shows the current step's
+# frame instead in the deck.
+#
+# Ids in a series are all given the series' prefix, since several figures
+# may end up inline in the same HTML document, where ids must be unique.
+#
+# from_layers builds a series from frames drawn in Inkscape, which differ
+# only in which layers are visible. Run this file to do that:
+#
+#   python svgframes.py images/squaring-frames.svg images/squaring-[0-8].svg
+
+# Elements that only matter to the editor, which from_layers leaves out.
+editor_tags = ['metadata', 'sodipodi:namedview']
+
+reference_pattern = re.compile(r'url\(#([^)]+)\)')
+
+class FrameSeries(object):
+    def __init__(self, picture, prefix=''):
+        self.picture = picture
+        self.prefix = prefix
+        self.parts = collections.OrderedDict()
+        self.frames = []
+
+    # Make element a part frames can share, and return its id, made from
+    # name, or numbered if name is None.
+    def part(self, element, name=None):
+        id_ = self.prefix + (name or 'part-{}'.format(len(self.parts)))
+        element.setAttribute('id', id_)
+        self.parts[id_] = element
+        return id_
+
+    # Add a frame showing items, in order: each is either a part's id, or
+    # an element to draw in this frame alone.
+    def frame(self, *items):
+        self.frames.append(list(items))
+
+    # Return a copy of the picture's root element, holding the background,
+    # the parts used by the given frames in <defs>, and then a group for
+    # each of those frames.
+    def build(self, frames):
+        doc = self.picture.doc
+        root = self.picture.root.cloneNode(True)
+        root.setAttribute('xmlns:xlink', 'http://www.w3.org/1999/xlink')
+        used = set(item for frame in frames for item in frame if item in self.parts)
+        if used:
+            defs = doc.createElement('defs')
+            for (id_, element) in self.parts.items():
+                if id_ in used:
+                    defs.appendChild(element.cloneNode(True))
+            root.appendChild(defs)
+        for (step, frame) in enumerate(frames):
+            group = doc.createElement('g')
+            group.setAttribute('class', 'frame step-{}'.format(step))
+            if step > 0:
+                group.setAttribute('display', 'none')
+            for item in frame:
+                if item in self.parts:
+                    use = doc.createElement('use')
+                    use.setAttribute('xlink:href', '#' + item)
+                    group.appendChild(use)
+                else:
+                    group.appendChild(item.cloneNode(True))
+            root.appendChild(group)
+        return root
+
+    def write(self, name, root, compact):
+        (addindent, newl) = layout(compact)
+        with codecs.open(name, 'w', 'utf-8') as f:
+            f.write('<?xml version="1.0" encoding="utf-8"?>' + newl)
+            root.writexml(f, '', addindent, newl)
+            print(file=f)
+
+    # Write each frame to a file of its own, named by formatting pattern
+    # with the frame's number, like 'images/squaring-{}.svg'. Each file
+    # holds only the parts its frame uses.
+    def save_frames(self, pattern, compact=False):
+        for (i, frame) in enumerate(self.frames):
+            self.write(pattern.format(i), self.build([frame]), compact)
+
+    # Write all the frames to a single file called name, to be stepped
+    # through.
+    def save_stepped(self, name, compact=False):
+        self.write(name, self.build(self.frames), compact)
+
+    # Return a FrameSeries made from the Inkscape drawings in the files
+    # named by filenames, which must be identical apart from which of their
+    # top-level layers are displayed. Each layer becomes a part, and each
+    # file a frame, showing the layers it displays. Ids are given prefix.
+    @classmethod
+    def from_layers(cls, filenames, prefix=''):
+        picture = SVGPicture.load(filenames[0])
+        root = picture.root
+        for tag in editor_tags:
+            for element in root.getElementsByTagName(tag):
+                element.parentNode.removeChild(element)
+        strip_whitespace(root)
+        add_prefix(root, prefix)
+
+        series = cls(picture, prefix)
+        layers = [node for node in root.childNodes if is_layer(node)]
+        for layer in layers:
+            root.removeChild(layer)
+            remove_display(layer)
+            series.parts[layer.getAttribute('id')] = layer
+
+        for filename in filenames:
+            shown = dict((prefix + layer.getAttribute('id'), is_displayed(layer))
+                         for layer in xml.dom.minidom.parse(filename).documentElement.childNodes
+                         if is_layer(layer))
+            series.frame(*[layer.getAttribute('id') for layer in layers
+                           if shown[layer.getAttribute('id')]])
+        return series
+
+def is_layer(node):
+    return (node.nodeType == xml.dom.Node.ELEMENT_NODE and node.tagName == 'g'
+            and node.getAttribute('inkscape:groupmode') == 'layer')
+
+# Return the declarations in element's style attribute, as an ordered
+# dictionary.
+def style(element):
+    declarations = collections.OrderedDict()
+    for declaration in element.getAttribute('style').split(';'):
+        if ':' in declaration:
+            (name, value) = declaration.split(':', 1)
+            declarations[name.strip()] = value.strip()
+    return declarations
+
+def is_displayed(element):
+    return (style(element).get('display', 'inline') != 'none'
+            and element.getAttribute('display') != 'none')
+
+# Remove the display property from element's style.
+def remove_display(element):
+    declarations = style(element)
+    declarations.pop('display', None)
+    if declarations:
+        element.setAttribute('style', ';'.join('{}:{}'.format(name, value)
+                                               for (name, value) in declarations.items()))
+    elif element.hasAttribute('style'):
+        element.removeAttribute('style')
+
+# Remove whitespace-only text nodes below element, which writexml would
+# otherwise indent over again, except where xml:space="preserve" makes
+# them significant.
+def strip_whitespace(element):
+    for node in list(element.childNodes):
+        if node.nodeType == xml.dom.Node.TEXT_NODE and not node.data.strip():
+            element.removeChild(node)
+        elif (node.nodeType == xml.dom.Node.ELEMENT_NODE
+              and node.getAttribute('xml:space') != 'preserve'):
+            strip_whitespace(node)
+
+# Put prefix on the front of every id below element, including element's
+# own, and update the url(#id) and xlink:href="#id" references to them.
+def add_prefix(element, prefix):
+    elements = [element] + element.getElementsByTagName('*')
+    ids = set(e.getAttribute('id') for e in elements if e.hasAttribute('id'))
+    def rename(match):
+        id_ = match.group(1)
+        return 'url(#{})'.format(prefix + id_ if id_ in ids else id_)
+    for e in elements:
+        for (name, value) in e.attributes.items():
+            if name == 'id':
+                e.setAttribute(name, prefix + value)
+            elif name in ('xlink:href', 'href') and value[1:] in ids:
+                e.setAttribute(name, '#' + prefix + value[1:])
+            elif 'url(#' in value:
+                e.setAttribute(name, reference_pattern.sub(rename, value))
+
+def main(argv):
+    if len(argv) < 3:
+        sys.exit('usage: python svgframes.py OUTPUT FRAME.svg...\n'
+                 'Combine Inkscape frames that differ only in which layers they show '
+                 'into a single stepped SVG file.')
+    output = argv[1]
+    # 'images/squaring-frames.svg' gets ids like 'squaring-frames-layer2'.
+    prefix = output.split('/')[-1].rsplit('.', 1)[0] + '-'
+    FrameSeries.from_layers(argv[2:], prefix).save_stepped(output, compact=True)
+
+if __name__ == '__main__':
+    main(sys.argv)
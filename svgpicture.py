@@ -1,5 +1,7 @@
 from __future__ import print_function
+import contextlib
 import xml.dom
+import xml.dom.minidom
 
 # Bookkeeping helpers for an SVG XML document. self.root is an xml.dom
 # document element in the document self.doc.
@@ -17,9 +19,20 @@ class SVGPicture(object):
         self.root.setAttribute('height', realHeight)
         self.root.setAttribute('viewBox', '0 0 %d %d' % pixelWidthHeight) # user unit is pt
 
-    def save_as(self, name):
+    # Return an SVGPicture holding the SVG file called name.
+    @classmethod
+    def load(cls, name):
+        picture = cls.__new__(cls)
+        picture.doc = xml.dom.minidom.parse(name)
+        picture.root = picture.doc.documentElement
+        return picture
+
+    # Write the picture to the file called name, indented, or if compact is
+    # true, without any indentation or newlines.
+    def save_as(self, name, compact=False):
         with open(name, 'w') as f:
-            self.doc.writexml(f, addindent='  ', newl='\n')
+            (addindent, newl) = layout(compact)
+            self.doc.writexml(f, addindent=addindent, newl=newl)
             print(file=f)
 
     def line(self, (x1, y1), (x2, y2), **attributes):
@@ -53,6 +66,128 @@ class SVGPicture(object):
     def defs(self):
         return self.doc.createElement('defs')
 
+# Write an SVG document to a file as it is drawn, rather than building it
+# in memory and writing it at the end as SVGPicture does, for figures with
+# too many elements for xml.dom to handle comfortably. The line, rect, path
+# and text methods take the same arguments as SVGPicture's, but write the
+# element out instead of returning it; group and defs are context managers
+# whose bodies write the group's contents:
+#
+#   with SVGWriter(open('figure.svg', 'w'), ('1280px', '720px'), (1280, 720)) as pic:
+#       pic.rect((0, 0), (1280, 720), fill='white')
+#       with pic.group(stroke='black'):
+#           pic.line((0, 360), (1280, 360))
+#
+# The output is the same as SVGPicture.save_as would write for the same
+# drawing, indentation included, unless compact is true.
+#
+# Code that builds xml.dom elements with an SVGPicture can draw into an
+# SVGWriter too: build the elements with self.dom, and pass them to append.
+class SVGWriter(object):
+    def __init__(self, file, (realWidth, realHeight), pixelWidthHeight, compact=False):
+        self.file = file
+        self.dom = SVGPicture((realWidth, realHeight), pixelWidthHeight)
+        (self.addindent, self.newl) = layout(compact)
+        self.open = []
+        # True if the innermost open element's start tag lacks its '>',
+        # because we don't know yet whether it will have any children.
+        self.pending = False
+
+        file.write('<?xml version="1.0" ?>' + self.newl)
+        self.dom.doc.doctype.writexml(file, '', self.addindent, self.newl)
+        self.start('svg', **dict(self.dom.root.attributes.items()))
+
+    def indent(self):
+        return self.addindent * len(self.open)
+
+    # Finish the start tag of the innermost open element, if need be, before
+    # writing a child.
+    def child(self):
+        if self.pending:
+            self.file.write('>' + self.newl)
+            self.pending = False
+
+    def write_start(self, tag, attributes):
+        self.child()
+        self.file.write(self.indent() + '<' + tag)
+        for name in sorted(attributes):
+            self.file.write(' %s="%s"' % (name, escape(str(attributes[name]))))
+
+    # Open an element, whose children are written until the matching end.
+    def start(self, tag, **attributes):
+        self.write_start(tag, attributes)
+        self.pending = True
+        self.open.append(tag)
+
+    def end(self):
+        tag = self.open.pop()
+        if self.pending:
+            self.file.write('/>' + self.newl)
+            self.pending = False
+        else:
+            self.file.write(self.indent() + '</%s>%s' % (tag, self.newl))
+
+    # Write a complete element, with text content if content is given.
+    def element(self, tag, content=None, **attributes):
+        self.write_start(tag, attributes)
+        if content:
+            self.file.write('>%s</%s>%s' % (escape(str(content)), tag, self.newl))
+        else:
+            self.file.write('/>' + self.newl)
+
+    # Write node, an xml.dom node, perhaps built with self.dom.
+    def append(self, node):
+        self.child()
+        node.writexml(self.file, self.indent(), self.addindent, self.newl)
+
+    def line(self, (x1, y1), (x2, y2), **attributes):
+        attributes.update({'x1':x1, 'y1':y1, 'x2':x2, 'y2':y2})
+        self.element('line', **attributes)
+
+    def rect(self, (x, y), (width, height), **attributes):
+        attributes.update({'x':x, 'y':y, 'width':width, 'height':height})
+        self.element('rect', **attributes)
+
+    def path(self, d, **attributes):
+        attributes['d'] = d
+        self.element('path', **attributes)
+
+    def text(self, content=None, **attributes):
+        self.element('text', content, **attributes)
+
+    @contextlib.contextmanager
+    def group(self, **attributes):
+        self.start('g', **attributes)
+        yield
+        self.end()
+
+    @contextlib.contextmanager
+    def defs(self):
+        self.start('defs')
+        yield
+        self.end()
+
+    # Close the document's open elements. This does not close self.file.
+    def close(self):
+        while self.open:
+            self.end()
+        print(file=self.file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# Return the (addindent, newl) arguments for writexml.
+def layout(compact):
+    return ('', '') if compact else ('  ', '\n')
+
+# Escape text and attribute values as xml.dom's writexml does.
+def escape(data):
+    return (data.replace('&', '&amp;').replace('<', '&lt;')
+            .replace('"', '&quot;').replace('>', '&gt;'))
+
 def setAttributes(element, **d):
     for (key, value) in d.items():
         element.setAttribute(key, str(value))